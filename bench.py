@@ -0,0 +1,357 @@
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from compact import compact_frame
+from engines import DEFAULT_ENGINE, ENGINES, get_engine
+from merge import merge_frames
+from normalize import normalize_numeric_columns
+from outputs import OUTPUT_FORMATS
+from pipeline import PipelineRun
+from schemas import schema_for
+from sheet_plan import build_sheet_plan, source_sheets
+from workbooks import WorkbookSession
+
+# Benchmark of the transform pipeline on synthetic workbooks shaped like the LOB and
+# reinsurance files: the 8-row header block, the group 1-4 sheets, and the column
+# counts and row volumes of the sheets in processed_sheets.zip. Every run happens
+# in a fresh process so its peak memory is its own, and the results are written as
+# JSON so that releases can be compared. With --parity the runs instead check that
+# every engine (engines.py) writes the same CSV bytes for every merged sheet.
+
+STAGES = ["open", "read", "normalize", "merge", "compact", "serialize", "zip"]
+
+# {sheet: (text column names, numeric column names, rows per workbook)}, from
+# the sheets of processed_sheets.zip; the projection periods of the cash-flow
+# sheets are number cells in the header row, as in the workbooks
+_CF_SHAPE = (["GOC_ID", "VARIABLE_NAME"], ["PV"] + list(range(1201)), 208)
+SHEET_SHAPES = {
+    "ACTUALS_FOR_VISUALIZATION": (["GOC_ID", "VARIABLE_NAME"], ["1"], 416),
+    "ACTUARIAL_AOM_IMPACT": (["GOC_ID", "STEP_ID", "* MACRO_STEP_ID_DESCRIPTION"], ["1"], 988),
+    "CURVE_ID_PARAM": (["GOC_ID", "VARIABLE_NAME", "1"], [], 104),
+    "INITIALIZATION": (["GOC_ID"], ["INIT_PVFC_LRC", "INIT_DA_LRC", "INIT_PVFC_LIC", "INIT_DA_LIC", "INIT_RA_LRC"]
+                       + [f"INIT_{i}" for i in range(10)], 52),
+    "MANDATORY_ACTUALS": (["GOC_ID", "VARIABLE_NAME"], ["1"], 832),
+    "MP_GOC": (["GOC_ID", "MEASUREMENT_MODEL", "AOM_ID", "INCEPTION_CURVE_ID", "TIMING_INCEPTION_CURVE",
+                "CSM_RELEASE_RATIO_CURVE_ID", "OCI_OPTION", "OCI_OPTION_LRC", "OCI_OPTION_LIC", "GOC_TYPE_IF_NB",
+                "GOC_CURRENCY", "REPORTING_CURRENCY", "GOC_TYPE_REINSURANCE"] + [f"AGGREG_{i}_ID" for i in range(1, 6)],
+               ["ANNUAL_COHORT", "SHARE_TECH_EXP_ENTITY_SHARE", "GOC_DURATION"], 52),
+    "MP_GOC_SEG": (["GOC_SEG_ID", "GOC_ID", "SEG_ID"], ["ALLOCATION_RATIO"], 52),
+    "OCI_OPTION_DERECOG": (["GOC_ID", "VARIABLE_NAME"], ["1"], 104),
+}
+
+# Share of numeric columns holding non-integral values (the rest are whole numbers)
+_FLOAT_SHARE = 0.07
+
+parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic LOB/reinsurance workbooks")
+parser.add_argument("--files", type=int, nargs="+", default=[1, 10, 100],
+                    help="numbers of workbooks per run (default: 1 10 100)")
+parser.add_argument("--input-format", choices=["xlsx", "xlsb"], nargs="+", default=["xlsx", "xlsb"],
+                    help="workbook formats to benchmark (default: both)")
+parser.add_argument("--format", choices=list(OUTPUT_FORMATS), default="csv", help="output format (default: csv)")
+parser.add_argument("--rows-scale", type=float, default=1.0,
+                    help="multiplier on the rows per sheet of processed_sheets.zip (default: 1.0)")
+parser.add_argument("--distinct", type=int, default=2,
+                    help="distinct synthetic workbooks per format; runs cycle through copies of them (default: 2)")
+parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "lobs_reserves_bench"),
+                    help="where the synthetic workbooks are generated and kept between runs")
+parser.add_argument("--engine", choices=list(ENGINES), default=DEFAULT_ENGINE,
+                    help=f"engine writing the CSV files (default: {DEFAULT_ENGINE})")
+parser.add_argument("--parity", action="store_true",
+                    help="instead of timing the pipeline, check that every engine writes the same CSV bytes for "
+                         "every merged sheet")
+parser.add_argument("--out", default="bench_results.json", help="JSON results file (default: bench_results.json)")
+
+
+def sheet_shape(sheet):
+    return SHEET_SHAPES.get(sheet, _CF_SHAPE)
+
+
+def header_block(title, seed=1):
+    # The 8 rows above the column header of a sheet (read with skiprows=8)
+    return [[title], ["Synthetic benchmark workbook"], ["Seed", seed]] + [[] for _ in range(5)]
+
+
+def synthetic_rows(sheet, seed, rows_scale=1.0):
+    # Cell rows of one sheet: the 8-row header block, the column header and data
+    text_cols, num_cols, rows = sheet_shape(sheet)
+    rows = max(1, round(rows * rows_scale))
+    rng = np.random.default_rng(seed)
+    values = rng.integers(-10 ** 6, 10 ** 6, size=(rows, len(num_cols))).astype(float)
+    floats = rng.random(len(num_cols)) < _FLOAT_SHARE
+    values[:, floats] += rng.random((rows, int(floats.sum()))).round(4)
+
+    block = header_block(sheet, seed)
+    data = [[f"{name}_{seed}_{i % 64}" for name in text_cols] + values[i].tolist() for i in range(rows)]
+    for row in data:
+        for j in range(len(text_cols), len(row)):
+            if row[j].is_integer():
+                row[j] = int(row[j])
+    return block + [text_cols + num_cols] + data
+
+
+def write_xlsx(path, sheets):
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+
+
+def _record(rec_id, payload=b""):
+    head = bytes([rec_id & 0xFF]) + (bytes([rec_id >> 8]) if rec_id > 0xFF else b"")
+    size, length = len(payload), b""
+    while True:
+        b, size = size & 0x7F, size >> 7
+        length += bytes([b | (0x80 if size else 0)])
+        if not size:
+            return head + length + payload
+
+
+def _wide_string(s):
+    return struct.pack("<I", len(s)) + s.encode("utf-16-le")
+
+
+def write_xlsb(path, sheets):
+    # Minimal BIFF12 workbook (no styles): shared strings, RK numbers for small
+    # integers and doubles for the rest, which is what Excel itself writes, and
+    # booleans; None leaves the cell blank
+    strings, string_ids = [], {}
+    parts = {}
+    for i, (name, rows) in enumerate(sheets.items(), start=1):
+        width = max(len(row) for row in rows)
+        out = [_record(0x0181), _record(0x0194, struct.pack("<IIII", 0, len(rows) - 1, 0, width - 1)),
+               _record(0x0191)]
+        for r, row in enumerate(rows):
+            out.append(_record(0x0000, struct.pack("<I", r) + bytes(21)))
+            for c, v in enumerate(row):
+                if v is None:
+                    continue
+                if isinstance(v, bool):
+                    out.append(_record(0x0004, struct.pack("<IIB", c, 0, v)))
+                elif isinstance(v, str):
+                    if v not in string_ids:
+                        string_ids[v] = len(strings)
+                        strings.append(v)
+                    out.append(_record(0x0007, struct.pack("<III", c, 0, string_ids[v])))
+                elif isinstance(v, int) and -2 ** 29 <= v < 2 ** 29:
+                    out.append(_record(0x0002, struct.pack("<IIi", c, 0, (v << 2) | 2)))
+                else:
+                    out.append(_record(0x0005, struct.pack("<IId", c, 0, float(v))))
+        out += [_record(0x0192), _record(0x0182)]
+        parts[f"xl/worksheets/sheet{i}.bin"] = b"".join(out)
+
+    book = [_record(0x0183), _record(0x018F)]
+    for i, name in enumerate(sheets, start=1):
+        book.append(_record(0x019C, struct.pack("<II", 0, i) + _wide_string(f"rId{i}") + _wide_string(name)))
+    book += [_record(0x0190), _record(0x0184)]
+    parts["xl/workbook.bin"] = b"".join(book)
+    parts["xl/sharedStrings.bin"] = b"".join(
+        [_record(0x019F, struct.pack("<II", len(strings), len(strings)))]
+        + [_record(0x0013, b"\x00" + _wide_string(s)) for s in strings] + [_record(0x01A0)])
+
+    rel_ns = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    rels = "".join(f'<Relationship Id="rId{i}" Type="{rel_ns}/worksheet" Target="worksheets/sheet{i}.bin"/>'
+                   for i in range(1, len(sheets) + 1))
+    rels += f'<Relationship Id="rId{len(sheets) + 1}" Type="{rel_ns}/sharedStrings" Target="sharedStrings.bin"/>'
+    package_rels = "http://schemas.openxmlformats.org/package/2006/relationships"
+    parts["xl/_rels/workbook.bin.rels"] = f'<Relationships xmlns="{package_rels}">{rels}</Relationships>'.encode()
+    parts["_rels/.rels"] = (f'<Relationships xmlns="{package_rels}"><Relationship Id="rId1" '
+                            f'Type="{rel_ns}/officeDocument" Target="xl/workbook.bin"/></Relationships>').encode()
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for part, data in parts.items():
+            zf.writestr(part, data)
+
+
+WRITERS = {"xlsx": write_xlsx, "xlsb": write_xlsb}
+
+
+def synthetic_workbooks(workdir, input_format, count, distinct=2, rows_scale=1.0):
+    # Paths of count workbooks: distinct generated ones, cycled as copies. The
+    # generated workbooks are kept in workdir and reused by later runs.
+    sheets = source_sheets(build_sheet_plan())
+    folder = os.path.join(workdir, f"{input_format}-x{rows_scale:g}")
+    os.makedirs(folder, exist_ok=True)
+    templates = []
+    for seed in range(min(distinct, count)):
+        path = os.path.join(folder, f"template{seed}.{input_format}")
+        if not os.path.exists(path):
+            WRITERS[input_format](path + ".tmp", {sheet: synthetic_rows(sheet, seed, rows_scale) for sheet in sheets})
+            os.replace(path + ".tmp", path)
+        templates.append(path)
+
+    run_folder = os.path.join(folder, f"run{count}")
+    os.makedirs(run_folder, exist_ok=True)
+    files = []
+    for i in range(count):
+        path = os.path.join(run_folder, f"file{i}.{input_format}")
+        if not os.path.exists(path):
+            shutil.copyfile(templates[i % len(templates)], path)
+        files.append(path)
+    return files
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_pipeline(files, output_format="csv", engine=DEFAULT_ENGINE):
+    # The transform.py pipeline, in-process and sequential so that each stage can
+    # be timed on its own. Serialization writes every member to memory first so
+    # that the encoding and the ZIP compression are measured separately.
+    timings = dict.fromkeys(STAGES, 0.0)
+    plan = build_sheet_plan()
+    sheets = source_sheets(plan)
+    frames = {sheet: [] for sheet in sheets}
+    rows = 0
+    start = time.perf_counter()
+
+    for path in files:
+        t = time.perf_counter()
+        session = WorkbookSession(path)
+        timings["open"] += time.perf_counter() - t
+        with session:
+            for sheet in sheets:
+                if not session.has_sheet(sheet):
+                    continue
+                schema = schema_for(sheet)
+                t = time.perf_counter()
+                df = session.read(sheet, **(schema.read_options() if schema else {}))
+                timings["read"] += time.perf_counter() - t
+                t = time.perf_counter()
+                df = schema.apply(df) if schema else normalize_numeric_columns(df)
+                timings["normalize"] += time.perf_counter() - t
+                frames[sheet].append(df)
+                rows += len(df)
+
+    t = time.perf_counter()
+    merged = {sheet: merge_frames(frames.pop(sheet)) for sheet in sheets}
+    timings["merge"] += time.perf_counter() - t
+    t = time.perf_counter()
+    merged = {sheet: compact_frame(df) for sheet, df in merged.items()}
+    timings["compact"] += time.perf_counter() - t
+
+    ext, write, compression = OUTPUT_FORMATS[output_format]
+    if output_format == "csv":
+        write = get_engine(engine).write_csv
+    with tempfile.TemporaryFile() as out, zipfile.ZipFile(out, "w", compression) as zipf:
+        for output, source in plan.items():
+            t = time.perf_counter()
+            buffer = io.BytesIO()
+            write(merged[source], buffer)
+            timings["serialize"] += time.perf_counter() - t
+            t = time.perf_counter()
+            zipf.writestr(f"{output}{ext}", buffer.getvalue())
+            timings["zip"] += time.perf_counter() - t
+
+    total = time.perf_counter() - start
+    return {
+        "stages": {stage: round(seconds, 4) for stage, seconds in timings.items()},
+        "total_seconds": round(total, 4),
+        "rows": rows,
+        "rows_per_sec": round(rows / total, 1) if total else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def check_parity(files, engines):
+    # Merge the workbooks once and write every merged sheet with each engine;
+    # the sheets whose CSV bytes differ between engines are reported
+    run = PipelineRun(files)
+    run.read(workers=1)
+    run.merge()
+    merged = run.take_processed_sheets()
+    mismatched = []
+    seconds = dict.fromkeys(engines, 0.0)
+    for sheet, df in merged.items():
+        outputs = []
+        for name in engines:
+            buffer = io.BytesIO()
+            t = time.perf_counter()
+            get_engine(name).write_csv(df, buffer)
+            seconds[name] += time.perf_counter() - t
+            outputs.append(buffer.getvalue())
+        if any(output != outputs[0] for output in outputs[1:]):
+            mismatched.append(sheet)
+    return {
+        "engines": list(engines),
+        "sheets": len(merged),
+        "mismatched": mismatched,
+        "errors": run.errors,
+        "serialize_seconds": {name: round(t, 4) for name, t in seconds.items()},
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parser.parse_args()
+    results = {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "output_format": args.format,
+        "engine": args.engine,
+        "rows_scale": args.rows_scale,
+        "runs": [],
+    }
+    for input_format in args.input_format:
+        for count in args.files:
+            files = synthetic_workbooks(args.workdir, input_format, count, args.distinct, args.rows_scale)
+            if args.parity:
+                run = {"input_format": input_format, "files": count, **check_parity(files, list(ENGINES))}
+                results["runs"].append(run)
+                print(f"{input_format} x{count}: {run['sheets'] - len(run['mismatched'])} of {run['sheets']} sheets "
+                      f"identical across {', '.join(run['engines'])}"
+                      + (f"; differing: {', '.join(run['mismatched'])}" if run["mismatched"] else ""))
+                continue
+            # A fresh process per run, so the reported peak memory is this run's
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                run = executor.submit(run_pipeline, files, args.format, args.engine).result()
+            run = {"input_format": input_format, "files": count, **run}
+            results["runs"].append(run)
+            summary = f"{input_format} x{count}: {run['total_seconds']:.2f}s, {run['rows_per_sec']} rows/s"
+            if run["peak_rss_mb"] is not None:
+                summary += f", peak {run['peak_rss_mb']:.0f} MB"
+            print(summary)
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved in {args.out}")
+    if args.parity and any(run["mismatched"] for run in results["runs"]):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+
+# Parsed sheets are cached on disk, keyed by the content hash of the workbook plus
+# the sheet name and read options, so re-runs only parse the files that changed.
+# Entries are pickles, and unpickling runs code, so the cache directory is private
+# to the user running the app: created with mode 0o700 under a per-user name, and
+# refused when it is owned by someone else or writable by other users.
+_USER = os.getuid() if hasattr(os, "getuid") else "user"
+
+
+def user_temp_directory(name):
+    # A folder under the temporary folder with this user's id in its name, so that
+    # the users of a shared machine do not share it
+    return os.path.join(tempfile.gettempdir(), f"{name}-{_USER}")
+
+
+DEFAULT_CACHE_DIR = os.environ.get("LOBS_CACHE_DIR", user_temp_directory("lobs_reserves_cache"))
+DEFAULT_CACHE_MAX_BYTES = int(os.environ.get("LOBS_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+# Bump when the reading or normalization of a sheet changes, so stale entries are
+# never served
+CACHE_VERSION = 2
+
+
+def content_hash():
+    # The hash object behind file_digest, for callers hashing data as it streams
+    return hashlib.blake2b(digest_size=20)
+
+
+def file_digest(file):
+    # Content hash of an upload (bytes) or of a file on disk (path)
+    h = content_hash()
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        h.update(file)
+    else:
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def private_directory(directory):
+    # Create directory for this user only, or check that an existing one is safe
+    # to keep private data in (pickles, uploads). Raises PermissionError for a
+    # symlink, a directory of another user, or one that other users can write to.
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        # Windows: the temporary folder is per user already
+        return directory
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise PermissionError(f"{directory} is not a private directory of this user; "
+                              f"remove it or choose another directory")
+    if st.st_mode & 0o077:
+        os.chmod(directory, 0o700)
+    return directory
+
+
+class SheetCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.directory = private_directory(directory)
+        self.max_bytes = max_bytes
+
+    def _path(self, digest, part):
+        return os.path.join(self.directory, f"{digest}-{part}-v{CACHE_VERSION}.pkl")
+
+    def _sheet_part(self, sheet, skiprows, normalize):
+        sheet_id = hashlib.blake2b(sheet.encode(), digest_size=8).hexdigest()
+        return f"{sheet_id}-s{skiprows}-{'n' if normalize else 'r'}"
+
+    def _load(self, path):
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # A truncated entry, or one pickled by another pandas version (which
+            # can fail with AttributeError, ImportError, TypeError...), is a miss;
+            # it is removed so it is written again
+            self._remove(path)
+            return None
+        # Touch the entry so eviction drops the least recently used ones first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _store(self, path, value):
+        # Write to a temporary name first so a concurrent reader never sees a
+        # partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def get_sheet_names(self, digest):
+        return self._load(self._path(digest, "index"))
+
+    def put_sheet_names(self, digest, sheet_names):
+        self._store(self._path(digest, "index"), sorted(sheet_names))
+
+    def get(self, digest, sheet, skiprows=8, normalize=True):
+        return self._load(self._path(digest, self._sheet_part(sheet, skiprows, normalize)))
+
+    def put(self, digest, sheet, df, skiprows=8, normalize=True):
+        self._store(self._path(digest, self._sheet_part(sheet, skiprows, normalize)), df)
+
+    def entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits in max_bytes
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
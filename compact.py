@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_string_dtype
+
+# Compaction of the merged sheets, which otherwise stay in memory as float64/int64
+# columns and strings repeated on every row for as long as the merge state is kept.
+# Float columns become float32 where every value survives the round trip, integer
+# columns the smallest integer type that holds them, and string columns with few
+# distinct values categoricals. The readers only produce float64, int64 and
+# string columns, so restore_frame maps every compacted dtype back to exactly the
+# dtype it came from.
+
+# A string column becomes categorical when it has at most this many distinct
+# values per row
+CATEGORY_RATIO = 0.5
+
+_INT_TYPES = [np.int8, np.int16, np.int32]
+
+
+def _float32_columns(values):
+    # Which columns of a float64 block are exactly representable as float32
+    narrowed = values.astype(np.float32).astype(np.float64)
+    return ((narrowed == values) | (np.isnan(narrowed) & np.isnan(values))).all(axis=0)
+
+
+def _int_types(values):
+    # The smallest integer type holding each column of an int64 block, None for
+    # the columns that need 64 bits
+    if not len(values):
+        return [None] * values.shape[1]
+    types = []
+    for low, high in zip(values.min(axis=0), values.max(axis=0)):
+        types.append(next((int_type for int_type in _INT_TYPES
+                           if np.iinfo(int_type).min <= low and high <= np.iinfo(int_type).max), None))
+    return types
+
+
+def _astype_blocks(df, targets):
+    # df.astype(targets) for a frame with many columns: the numeric columns going
+    # from one dtype to another are converted as one 2-D block, and the result has
+    # one block per dtype (to_csv slows down markedly on a frame made of a
+    # thousand single-column blocks)
+    if not targets:
+        return df
+    groups, pieces, kept = {}, [], {}
+    for column, dtype in df.dtypes.items():
+        target = targets.get(column)
+        if target is not None and isinstance(dtype, np.dtype) and isinstance(target, type):
+            groups.setdefault((dtype, target), []).append(column)
+        else:
+            kept[column] = df[column] if target is None else df[column].astype(target)
+    for (_, target), columns in groups.items():
+        pieces.append(pd.DataFrame(df[columns].to_numpy().astype(target), index=df.index, columns=columns))
+    if kept:
+        pieces.append(pd.DataFrame(kept, index=df.index, copy=False))
+    return pd.concat(pieces, axis=1)[list(df.columns)].copy()
+
+
+def compact_frame(df, category_ratio=CATEGORY_RATIO):
+    # A compacted copy of df; df itself is not changed
+    dtypes = df.dtypes
+    targets = {}
+    floats = [column for column, dtype in dtypes.items() if dtype == np.float64]
+    if floats:
+        for column, exact in zip(floats, _float32_columns(df[floats].to_numpy())):
+            if exact:
+                targets[column] = np.float32
+    ints = [column for column, dtype in dtypes.items() if dtype == np.int64]
+    if ints:
+        for column, int_type in zip(ints, _int_types(df[ints].to_numpy())):
+            if int_type is not None:
+                targets[column] = int_type
+    for column, dtype in dtypes.items():
+        if dtype == object or isinstance(dtype, pd.StringDtype):
+            series = df[column]
+            if is_string_dtype(series) and series.nunique() <= category_ratio * len(series):
+                targets[column] = "category"
+    return _astype_blocks(df, targets) if targets else df.copy()
+
+
+def _restored_dtypes(df, for_csv=False):
+    # {column: dtype before compact_frame} for the compacted columns of df
+    restored = {}
+    for column, dtype in df.dtypes.items():
+        if dtype == np.float32:
+            restored[column] = np.float64
+        elif dtype.kind == "i" and dtype.itemsize < 8 and not for_csv:
+            restored[column] = np.int64
+        elif isinstance(dtype, pd.CategoricalDtype) and not for_csv:
+            restored[column] = dtype.categories.dtype
+    return restored
+
+
+def original_dtypes(df):
+    # The dtype of every column of df as it was before compact_frame, without
+    # converting anything
+    restored = {column: np.dtype(dtype) if isinstance(dtype, type) else dtype
+                for column, dtype in _restored_dtypes(df).items()}
+    return {column: restored.get(column, dtype) for column, dtype in df.dtypes.items()}
+
+
+def restore_frame(df, for_csv=False):
+    # df with the dtypes it had before compact_frame. for_csv only restores the
+    # float32 columns: integer and categorical columns are written as the same
+    # CSV text as their original dtypes, float32 values are not.
+    return _astype_blocks(df, _restored_dtypes(df, for_csv))
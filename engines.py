@@ -0,0 +1,191 @@
+import csv
+import io
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Engines that turn the merged sheets into CSV text. Only this last stage is
+# swappable: reading, normalization and the merge run on pandas whichever engine
+# is picked. The pandas engine is the reference: DataFrame.to_csv, which formats every cell on one thread. The arrow
+# engine formats whole columns with pyarrow compute kernels, which release the
+# GIL, on a pool of threads over row chunks, and writes the same bytes: floats
+# use the same shortest round-trip digits as repr(), integral floats get their
+# ".0", and fields are quoted the way the csv module quotes them. Sheets with a
+# column it does not format (dates, mixed objects) and single-column sheets
+# (where csv quotes an empty field) are handed to the pandas engine. numpy, pandas
+# and pyarrow are imported when a sheet is written, so the app can list the
+# engines without loading them.
+
+DEFAULT_ENGINE = os.environ.get("LOBS_ENGINE", "pandas")
+
+DEFAULT_ENGINE_THREADS = os.cpu_count() or 1
+
+# Rows formatted per task; also keeps every string buffer far below 2 GB
+ARROW_CHUNK_ROWS = 1 << 16
+
+# repr() switches to exponent notation outside [1e-4, 1e16)
+_FIXED_MIN = 1e-4
+_FIXED_MAX = 1e16
+
+
+class PandasEngine:
+    name = "pandas"
+
+    def write_csv(self, df, handle):
+        # pandas writes the CSV to a handle in row chunks, so the full text of a
+        # sheet is never built as one string. Compacted sheets (compact.py) are
+        # written as the same text as before compaction.
+        from compact import restore_frame
+
+        df = restore_frame(df, for_csv=True)
+        text = io.TextIOWrapper(handle, encoding="utf-8", newline="")
+        df.to_csv(text, index=False)
+        text.flush()
+        text.detach()
+
+
+class _Unsupported(Exception):
+    # A column the arrow engine leaves to pandas
+    pass
+
+
+def _quoted_by_csv(char):
+    # Whether the csv module (which to_csv writes with) quotes a field holding
+    # char, with the "\n" line terminator to_csv uses. Whether "\r" is quoted
+    # then depends on the Python version.
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\n").writerow(["a" + char])
+    return out.getvalue().startswith('"')
+
+
+# The characters that make the csv module quote a field, as a regex class
+_QUOTE_PATTERN = "[" + "".join(pattern for char, pattern in (('"', '"'), (",", ","), ("\r", r"\r"), ("\n", r"\n"))
+                               if _quoted_by_csv(char)) + "]"
+
+
+def _quote(pc, strings):
+    # Quote the fields that csv.QUOTE_MINIMAL quotes, doubling their quotes
+    needed = pc.match_substring_regex(strings, _QUOTE_PATTERN)
+    if not pc.any(needed).as_py():
+        return strings
+    quoted = pc.binary_join_element_wise('"', pc.replace_substring(strings, '"', '""'), '"', "")
+    return pc.if_else(needed, quoted, strings)
+
+
+def _format_floats(pa, pc, values):
+    # float64 values as to_csv writes them: repr() digits, "" for NaN
+    import numpy as np
+
+    missing = np.isnan(values)
+    magnitude = np.abs(values)
+    integral = (values == np.floor(values)) & (magnitude < _FIXED_MAX)
+    strings = pc.cast(pa.array(values, mask=missing), pa.string())
+    if integral.any():
+        whole = pc.cast(pa.array(np.where(integral, values, 0).astype(np.int64)), pa.string())
+        strings = pc.if_else(pa.array(integral), pc.binary_join_element_wise(whole, ".0", ""), strings)
+    # Values repr() writes in exponent notation, -0.0, and the few where arrow
+    # picks exponent notation inside repr()'s fixed range
+    fix = np.isinf(values) | ((magnitude < _FIXED_MIN) & (values != 0)) | (magnitude >= _FIXED_MAX)
+    fix |= (values == 0) & np.signbit(values)
+    fix |= ~integral & ~missing & np.asarray(pc.fill_null(pc.match_substring(strings, "e"), False))
+    if fix.any():
+        strings = pc.replace_with_mask(strings, pa.array(fix),
+                                       pa.array([repr(value) for value in values[fix].tolist()], pa.string()))
+    return strings
+
+
+def _check_column(series):
+    # Raise _Unsupported for a column the arrow engine does not format
+    import numpy as np
+    import pandas as pd
+
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and (dtype.kind in "iub" or dtype == np.float64):
+        return
+    if isinstance(dtype, pd.CategoricalDtype):
+        if pd.api.types.is_string_dtype(dtype.categories):
+            return
+    elif pd.api.types.is_string_dtype(series) and pd.api.types.infer_dtype(series, skipna=True) in ("string", "empty"):
+        return
+    raise _Unsupported(series.name)
+
+
+def _format_column(pa, pc, series):
+    # One column (checked by _check_column) as an arrow string array, with nulls
+    # for the cells to_csv leaves empty
+    import numpy as np
+    import pandas as pd
+
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = _quote(pc, pa.array(dtype.categories.to_numpy(dtype=object), pa.string()))
+        codes = series.cat.codes.to_numpy()
+        return pc.take(categories, pa.array(codes, mask=codes < 0))
+    if dtype.kind == "f":
+        return _format_floats(pa, pc, series.to_numpy())
+    if dtype.kind in "iu":
+        return pc.cast(pa.array(series.to_numpy()), pa.string())
+    if dtype.kind == "b":
+        return pa.array(np.where(series.to_numpy(), "True", "False"), pa.string())
+    return _quote(pc, pa.array(series.to_numpy(dtype=object, na_value=None), pa.string()))
+
+
+def _format_rows(pa, pc, df):
+    # The CSV lines of a chunk of rows, as one buffer
+    import numpy as np
+
+    columns = [_format_column(pa, pc, df[column]) for column in df.columns]
+    lines = pc.binary_join_element_wise(*columns, ",", null_handling="replace", null_replacement="")
+    lines = pc.binary_join_element_wise(lines, "", "\n")
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int32)[lines.offset:lines.offset + len(lines) + 1]
+    return memoryview(lines.buffers()[2])[offsets[0]:offsets[-1]]
+
+
+class ArrowEngine(PandasEngine):
+    name = "arrow"
+
+    def __init__(self, threads=DEFAULT_ENGINE_THREADS, chunk_rows=ARROW_CHUNK_ROWS):
+        self.threads = threads
+        self.chunk_rows = chunk_rows
+
+    def write_csv(self, df, handle):
+        # pyarrow is only needed by this engine
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        from compact import restore_frame
+
+        df = restore_frame(df, for_csv=True)
+        if len(df.columns) < 2 or not df.columns.is_unique:
+            return super().write_csv(df, handle)
+        try:
+            for column in df.columns:
+                _check_column(df[column])
+        except _Unsupported:
+            return super().write_csv(df, handle)
+
+        header = io.StringIO()
+        csv.writer(header, lineterminator="\n").writerow([str(column) for column in df.columns])
+        handle.write(header.getvalue().encode("utf-8"))
+        # Chunks are formatted on the pool and written in order, with at most two
+        # per thread formatted ahead of the writer
+        starts = iter(range(0, len(df), self.chunk_rows))
+        threads = max(1, self.threads)
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            pending = deque()
+            for start in starts:
+                pending.append(pool.submit(_format_rows, pa, pc, df.iloc[start:start + self.chunk_rows]))
+                if len(pending) >= 2 * threads:
+                    handle.write(pending.popleft().result())
+            while pending:
+                handle.write(pending.popleft().result())
+
+
+ENGINES = {engine.name: engine for engine in (PandasEngine(), ArrowEngine())}
+
+
+def get_engine(name=DEFAULT_ENGINE):
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError(f"unknown engine {name!r}; choose from {', '.join(ENGINES)}") from None
@@ -0,0 +1,180 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+
+from cache import SheetCache, file_digest
+from normalize import normalize_numeric_columns
+from profiling import Trace, describe_frame
+from schemas import schema_for
+from spill import spill_frame
+from spool import MappedFile
+from workbooks import WorkbookSession
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# Start method of the worker processes. The app creates its pools inside the
+# Streamlit server, where other threads (Tornado, other sessions' scripts) may
+# hold a lock at the moment of a fork and leave it locked forever in the child;
+# spawned workers start from a fresh interpreter instead.
+START_METHOD = os.environ.get("LOBS_START_METHOD", "spawn")
+
+
+def create_executor(workers=DEFAULT_WORKERS):
+    # A pool of worker processes for read_workbook
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD))
+
+
+def workbook_source(file):
+    # In-memory uploads are sent to the workers as (name, bytes); paths (and
+    # spool.SpooledUploads) are sent as-is and mapped by the worker itself.
+    if hasattr(file, "getvalue"):
+        return file.name, file.getvalue()
+    return file
+
+
+class WorkbookResult:
+    # What one worker returns for one workbook
+    def __init__(self, name):
+        self.name = name
+        self.frames = {}
+        self.errors = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Timing spans of the open/read/normalize stages (see profiling.Trace)
+        self.spans = []
+
+
+def read_workbook(source, sheets, normalize=True, skiprows=8, cache_dir=None, spill_dir=None):
+    # Worker: open one workbook and read every requested sheet it contains. With a
+    # cache_dir, sheets parsed by an earlier run of the same file content are
+    # loaded from the cache and the workbook is only opened for the rest. With a
+    # spill_dir, every sheet is written there (see spill.py) and result.frames holds
+    # the spill paths instead of the frames.
+    if isinstance(source, tuple):
+        name, data = source
+        with io.BytesIO(data) as file:
+            return _read_workbook(name, file, data, sheets, normalize, skiprows, cache_dir, spill_dir)
+    # Files on disk are read through a memory map rather than a private copy
+    try:
+        file = MappedFile(source)
+    except OSError as e:
+        result = WorkbookResult(getattr(source, "name", source))
+        result.errors.append(f"Error opening {result.name}: {e}")
+        return result
+    with file:
+        return _read_workbook(getattr(source, "name", source), file, source, sheets, normalize, skiprows,
+                              cache_dir, spill_dir)
+
+
+def _read_workbook(name, file, data, sheets, normalize, skiprows, cache_dir, spill_dir):
+    # read_workbook on an open file; data is what file_digest hashes (the bytes or
+    # the path), unless it carries its digest already
+    result = WorkbookResult(name)
+    trace = Trace()
+    result.spans = trace.spans
+    sheets = list(dict.fromkeys(sheets))
+
+    cache = digest = None
+    if cache_dir:
+        try:
+            cache = SheetCache(cache_dir)
+            digest = getattr(data, "digest", None) or file_digest(data)
+        except OSError as e:
+            cache = None
+            result.errors.append(f"Parse cache unavailable for {name}: {e}")
+
+    if cache:
+        sheet_names = cache.get_sheet_names(digest)
+        if sheet_names is not None:
+            wanted = [sheet for sheet in sheets if sheet in sheet_names]
+            for sheet in wanted:
+                with trace.span("cache", name, sheet) as record:
+                    df = cache.get(digest, sheet, skiprows, normalize)
+                    if df is not None:
+                        describe_frame(record, df)
+                if df is not None:
+                    result.frames[sheet] = spill_frame(df, spill_dir) if spill_dir else df
+                    result.cache_hits += 1
+            if len(result.frames) == len(wanted):
+                return result
+
+    try:
+        with trace.span("open", name):
+            session = WorkbookSession(file, name=name)
+    except Exception as e:
+        result.errors.append(f"Error opening {name}: {e}")
+        return result
+
+    with session:
+        for sheet in sheets:
+            if sheet in result.frames or not session.has_sheet(sheet):
+                continue
+            # Known sheets are read straight into their declared types; the
+            # numeric inference only runs for the others
+            schema = schema_for(sheet) if normalize else None
+            try:
+                with trace.span("read", name, sheet) as record:
+                    df = session.read(sheet, skiprows=skiprows, **(schema.read_options() if schema else {}))
+                    describe_frame(record, df)
+                if normalize:
+                    with trace.span("normalize", name, sheet) as record:
+                        df = schema.apply(df) if schema else normalize_numeric_columns(df)
+                        describe_frame(record, df)
+            except Exception as e:
+                result.errors.append(f"Error reading {sheet} from {name}: {e}")
+                continue
+            if cache:
+                cache.put(digest, sheet, df, skiprows, normalize)
+                result.cache_misses += 1
+            result.frames[sheet] = spill_frame(df, spill_dir) if spill_dir else df
+            del df
+        if cache:
+            cache.put_sheet_names(digest, session.sheet_names)
+    return result
+
+
+def extract_all(files, sheets, workers=DEFAULT_WORKERS, normalize=True, skiprows=8, on_result=None,
+                cache_dir=None, read_plan=None, spill_dir=None, executor=None):
+    # Spread the workbooks over a process pool, one task per file, and return a
+    # WorkbookResult per file in the original file order so the merged output stays
+    # deterministic. read_plan optionally lists the sheets to read from each file
+    # (see workbook_index.plan_reads); files with nothing to read are skipped.
+    # on_result(done, total) is called as each workbook finishes. With an executor
+    # (e.g. the app's background parse pool) the workbooks are read on it rather
+    # than on a new pool; at most workers of them are submitted at a time.
+    if read_plan is None:
+        read_plan = [sheets] * len(files)
+    results = [None] * len(files)
+    tasks = []
+    for i, (file, file_sheets) in enumerate(zip(files, read_plan)):
+        if file_sheets:
+            tasks.append((i, workbook_source(file), file_sheets))
+        else:
+            results[i] = WorkbookResult(getattr(file, "name", file))
+
+    done = len(files) - len(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        for i, source, file_sheets in tasks:
+            results[i] = read_workbook(source, file_sheets, normalize, skiprows, cache_dir, spill_dir)
+            done += 1
+            if on_result:
+                on_result(done, len(files))
+        return results
+
+    with nullcontext(executor) if executor else create_executor(min(workers, len(tasks))) as pool:
+        pending = list(reversed(tasks))
+        running = {}
+        while pending or running:
+            while pending and len(running) < workers:
+                i, source, file_sheets = pending.pop()
+                running[pool.submit(read_workbook, source, file_sheets, normalize, skiprows, cache_dir, spill_dir)] = i
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results[running.pop(future)] = future.result()
+                done += 1
+                if on_result:
+                    on_result(done, len(files))
+    return results
+
@@ -0,0 +1,100 @@
+from collections import Counter
+
+import pandas as pd
+
+from cache import file_digest
+from compact import restore_frame
+from merge import merge_frames
+from profiling import describe_frame, span
+
+
+def upload_keys(files):
+    # Identify each upload by name and content, numbering identical uploads so
+    # that the same workbook selected twice is still merged twice
+    seen = Counter()
+    keys = []
+    for file in files:
+        # Spooled uploads were hashed when they were written
+        digest = getattr(file, "digest", None) or file_digest(file.getvalue() if hasattr(file, "getvalue") else file)
+        key = (getattr(file, "name", file), digest)
+        keys.append(key + (seen[key],))
+        seen[key] += 1
+    return keys
+
+
+class MergeState:
+    # Merged per-sheet frames of the last run plus, for every sheet, the rows and
+    # schema each workbook contributed (in file order). Adding, removing or
+    # replacing an upload then splices that file's rows in or out of the merged
+    # frames instead of re-reading and re-merging every workbook.
+    def __init__(self, sheets):
+        self.sheets = list(sheets)
+        self.keys = []
+        self.merged = {sheet: pd.DataFrame() for sheet in self.sheets}
+        self.segments = {sheet: [] for sheet in self.sheets}
+
+    def update(self, keys, frames_by_key, trace=None):
+        # keys is the new file order; frames_by_key holds {sheet: DataFrame} for every
+        # key that is not merged yet. The state is only changed once every sheet has
+        # been updated. With a profiling.Trace, every sheet merge is recorded.
+        merged, segments = {}, {}
+        for sheet in self.sheets:
+            added = {key: frames[sheet] for key, frames in frames_by_key.items() if sheet in frames}
+            with span(trace, "merge", sheet=sheet) as record:
+                merged[sheet], segments[sheet] = self._update_sheet(sheet, keys, added)
+                describe_frame(record, merged[sheet])
+        self.keys = list(keys)
+        self.merged, self.segments = merged, segments
+
+    def _update_sheet(self, sheet, keys, added):
+        # The merged frame may have been compacted (compact.py) since the last update
+        frame, segments = restore_frame(self.merged[sheet]), self.segments[sheet]
+        offsets, start = {}, 0
+        for key, rows, _ in segments:
+            offsets[key] = (start, start + rows)
+            start += rows
+
+        order = [key for key in keys if key in offsets or key in added]
+        kept = [key for key in order if key in offsets]
+        if not order:
+            return pd.DataFrame(), []
+
+        # Fast path: every workbook shares the merged schema and the kept files keep
+        # their relative order, so the merged frame is sliced and spliced as-is
+        schema = frame.dtypes
+        if (segments and kept == [key for key, _, _ in segments if key in kept]
+                and all(dtypes.equals(schema) for _, _, dtypes in segments)
+                and all(df.dtypes.equals(schema) for df in added.values())):
+            pieces, run = [], None
+            for key in order:
+                if key in added:
+                    if run:
+                        pieces.append(frame.iloc[run[0]:run[1]])
+                        run = None
+                    pieces.append(added[key])
+                elif run and run[1] == offsets[key][0]:
+                    run = (run[0], offsets[key][1])
+                else:
+                    if run:
+                        pieces.append(frame.iloc[run[0]:run[1]])
+                    run = offsets[key]
+            if run:
+                pieces.append(frame.iloc[run[0]:run[1]])
+            new_frame = pd.concat(pieces, ignore_index=True)
+        else:
+            # Schemas differ between files: rebuild the per-file frames of the kept
+            # workbooks from their row ranges and merge everything again (no parsing)
+            new_frame = merge_frames([added[key] if key in added else self._file_frame(sheet, key, offsets)
+                                      for key in order])
+
+        dtypes = {key: dt for key, _, dt in segments}
+        rows = {key: r for key, r, _ in segments}
+        new_segments = [(key, len(added[key]), added[key].dtypes) if key in added else (key, rows[key], dtypes[key])
+                        for key in order]
+        return new_frame, new_segments
+
+    def _file_frame(self, sheet, key, offsets):
+        # The frame one workbook contributed, with its own columns and dtypes
+        start, stop = offsets[key]
+        dtypes = next(dt for k, _, dt in self.segments[sheet] if k == key)
+        return self.merged[sheet].iloc[start:stop][list(dtypes.index)].astype(dtypes.to_dict())
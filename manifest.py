@@ -0,0 +1,141 @@
+import json
+import os
+import zipfile
+
+from parallel_zip import DEFAULT_ZIP_WORKERS, ZipWriter, write_members
+
+# Content manifests of the output packages. Every package is described by a
+# manifest listing, for each output sheet in plan order, its ZIP member, row
+# count, columns (with the dtypes the sheet had before compaction) and the content
+# hash of the member data (as cache.file_digest). The manifest is written next to
+# the package (processed_sheets.zip -> processed_sheets.manifest.json).
+#
+# A delta package holds only the members whose hash differs from a previous
+# manifest, plus a manifest.json member: the manifest of the full package it
+# stands for, with a "delta" entry naming the output sheets it carries and the ones
+# that were dropped. apply_delta() rebuilds the full package from the previous
+# one and a delta, checking every member against the manifest.
+
+MANIFEST_VERSION = 1
+
+# The manifest member of a delta package
+MANIFEST_MEMBER = "manifest.json"
+
+
+def manifest_path(zip_path):
+    # Where the manifest of a package is written
+    return os.path.splitext(zip_path)[0] + ".manifest.json"
+
+
+def delta_filename(zip_name):
+    # processed_sheets.zip -> processed_sheets_delta.zip
+    stem, ext = os.path.splitext(zip_name)
+    return f"{stem}_delta{ext}"
+
+
+def new_manifest(output_format):
+    return {"version": MANIFEST_VERSION, "format": output_format, "sheets": {}}
+
+
+def sheet_entry(member, rows, columns, digest):
+    # columns: [(name, dtype)], kept in order as {name: dtype name}
+    return {"member": member, "rows": rows, "columns": {str(name): str(dtype) for name, dtype in columns},
+            "digest": digest}
+
+
+def sheet_changed(sheet, entry, base):
+    # Whether the member of an output sheet differs from the one in the base
+    # manifest (always without a base)
+    if base is None:
+        return True
+    previous = base["sheets"].get(sheet)
+    return previous is None or previous["member"] != entry["member"] or previous["digest"] != entry["digest"]
+
+
+def mark_delta(manifest, base, sheets):
+    # Record in manifest that its package is a delta on base carrying the members
+    # of sheets
+    manifest["delta"] = {"sheets": list(sheets),
+                         "removed": [sheet for sheet in (base or {}).get("sheets", {})
+                                     if sheet not in manifest["sheets"]]}
+    return manifest
+
+
+def full_manifest(manifest):
+    # The manifest without its delta entry: the one of the full package
+    return {key: value for key, value in manifest.items() if key != "delta"}
+
+
+def dumps_manifest(manifest):
+    return json.dumps(manifest, indent=1).encode("utf-8")
+
+
+def write_manifest(path, manifest):
+    with open(path, "wb") as f:
+        f.write(dumps_manifest(manifest))
+
+
+def load_manifest(source):
+    # A manifest from a JSON file (path or binary file), or the manifest.json of
+    # a delta package. Raises ValueError when it is not a manifest.
+    if isinstance(source, (str, os.PathLike)) and zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            manifest = json.loads(zf.read(MANIFEST_MEMBER))
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            manifest = json.load(f)
+    else:
+        manifest = json.load(source)
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("sheets"), dict):
+        raise ValueError("no sheets listed")
+    return manifest
+
+
+def apply_delta(base_zip, delta_zip, out_zip, compresslevel=None, workers=DEFAULT_ZIP_WORKERS):
+    # Write to out_zip the full package a delta package stands for: its own
+    # members, and every other member of the manifest taken from base_zip. Raises
+    # ValueError when a member is missing or its content does not match the
+    # manifest (e.g. the delta was made against another package). Returns the
+    # manifest of the new package, which is also written next to it. The package
+    # is written to a temporary file that replaces out_zip once complete, so
+    # out_zip can be base_zip itself, and a failure leaves out_zip as it was.
+    from outputs import OUTPUT_FORMATS
+
+    tmp_zip = f"{out_zip}.{os.getpid()}.tmp"
+    try:
+        with zipfile.ZipFile(delta_zip) as delta, zipfile.ZipFile(base_zip) as base:
+            try:
+                manifest = json.loads(delta.read(MANIFEST_MEMBER))
+            except KeyError:
+                raise ValueError(f"{delta_zip} is not a delta package (no {MANIFEST_MEMBER})") from None
+            if "delta" not in manifest:
+                raise ValueError(f"{delta_zip} is not a delta package")
+            carried = set(manifest["delta"]["sheets"])
+            names = {delta: set(delta.namelist()), base: set(base.namelist())}
+            expected = {}
+            members = []
+            for sheet, entry in manifest["sheets"].items():
+                name = entry["member"]
+                source = delta if sheet in carried else base
+                if name not in names[source]:
+                    raise ValueError(f"{name} is missing from {delta_zip if sheet in carried else base_zip}")
+                expected[name] = entry["digest"]
+                members.append((name, entry["digest"], lambda source=source, name=name: source.open(name)))
+
+            def check(name, member):
+                if member.digest != expected[name]:
+                    raise ValueError(f"{name} does not match the manifest of {delta_zip}; "
+                                     f"was the delta made against {base_zip}?")
+                return True
+
+            compression = OUTPUT_FORMATS[manifest["format"]][2]
+            with ZipWriter(tmp_zip, compression, compresslevel=compresslevel) as zipw:
+                write_members(zipw, members, workers=workers, keep=check)
+        os.replace(tmp_zip, out_zip)
+    except BaseException:
+        if os.path.exists(tmp_zip):
+            os.remove(tmp_zip)
+        raise
+    manifest = full_manifest(manifest)
+    write_manifest(manifest_path(out_zip), manifest)
+    return manifest
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+
+def reconcile_schema(frames):
+    # Union of the columns of every frame, in first-seen order, with the dtype of
+    # the first frame that has each column.
+    schema = {}
+    for df in frames:
+        for col, dtype in df.dtypes.items():
+            if col not in schema:
+                schema[col] = dtype
+    return schema
+
+
+def _missing_column(dtype, index):
+    # Integer and bool columns cannot hold NaN, so a file missing one of them
+    # upcasts the merged column the same way a NaN-filled concat would.
+    if dtype.kind in "iu":
+        dtype = np.dtype("float64")
+    elif dtype.kind == "b":
+        dtype = np.dtype("object")
+    return pd.Series(np.nan, index=index, dtype=dtype)
+
+
+def align_frame(df, schema):
+    columns = list(schema)
+    if list(df.columns) == columns:
+        return df
+    aligned = df.copy(deep=False)
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            aligned[col] = _missing_column(dtype, df.index)
+    return aligned[columns]
+
+
+def merge_frames(frames):
+    # Collect the per-file frames of one sheet and concatenate them once, instead
+    # of growing a merged frame file by file (which copies it on every append).
+    frames = [df for df in frames if df is not None]
+    if not frames:
+        return pd.DataFrame()
+    schema = reconcile_schema(frames)
+    return pd.concat([align_frame(df, schema) for df in frames], ignore_index=True)
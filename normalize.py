@@ -0,0 +1,28 @@
+import pandas as pd
+
+NUMERIC_THRESHOLD = 0.9
+
+
+def normalize_numeric_columns(df, threshold=NUMERIC_THRESHOLD):
+    # Normalize numeric columns conditionally: every column after the first is made
+    # numeric (blanks become 0) when more than 90% of its cells are numbers or blank.
+    for col in df.columns[1:]:
+        series = df[col]
+        kind = series.dtype.kind
+
+        # The Excel engines already report numeric cells, so columns that came back
+        # typed as numbers only need their blanks filled. Bools and dates are kept.
+        if kind in "iufc":
+            if series.hasnans:
+                df[col] = series.fillna(0)
+            continue
+        if kind in "bmM":
+            continue
+
+        # Mixed/text columns: a single vectorized pass, which also accepts negative
+        # values and scientific notation
+        converted = pd.to_numeric(series, errors='coerce')
+        numeric_like = converted.notna() | series.isna()
+        if len(series) and numeric_like.mean() > threshold:
+            df[col] = converted.fillna(0)
+    return df
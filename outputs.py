@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import zipfile
+
+from engines import DEFAULT_ENGINE, get_engine
+from manifest import MANIFEST_MEMBER, dumps_manifest, mark_delta, new_manifest, sheet_changed, sheet_entry
+from parallel_zip import DEFAULT_ZIP_WORKERS, ZipWriter, write_members
+from profiling import describe_frame, span
+
+# zlib level used for the ZIP members; None keeps zlib's default (6)
+DEFAULT_COMPRESSLEVEL = None
+
+
+def _write_csv(df, handle, engine=DEFAULT_ENGINE):
+    # The CSV text of a sheet, from the given engine (see engines.py)
+    get_engine(engine).write_csv(df, handle)
+
+
+def _arrow_ready(df):
+    # Parquet needs string column names and one type per column. Numeric columns
+    # keep the dtype the normalization decided; columns that still mix text and
+    # numbers are stored as text, the way they appear in the CSV.
+    import pandas as pd
+
+    df = df.rename(columns=str)
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+            df[col] = series.astype(str).where(series.notna(), None)
+    return df
+
+
+def _write_parquet(df, handle):
+    # pyarrow is only needed for the Parquet output
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from compact import restore_frame
+
+    table = pa.Table.from_pandas(_arrow_ready(restore_frame(df)), preserve_index=False)
+    pq.write_table(table, handle, compression="zstd")
+
+
+# Output formats: member extension, serializer and ZIP compression. Parquet is
+# already compressed, so its members are stored as-is.
+OUTPUT_FORMATS = {
+    "csv": (".csv", _write_csv, zipfile.ZIP_DEFLATED),
+    "parquet": (".parquet", _write_parquet, zipfile.ZIP_STORED),
+}
+
+
+# Name of the package each format produces (and publishes under Dodo_results/)
+OUTPUT_FILENAMES = {
+    "csv": "processed_sheets.zip",
+    "parquet": "processed_sheets_parquet.zip",
+}
+
+
+def write_sheets_zip(zip_path, plan, processed_sheets, output_format="csv", compresslevel=DEFAULT_COMPRESSLEVEL,
+                     trace=None, workers=DEFAULT_ZIP_WORKERS, base_manifest=None, engine=DEFAULT_ENGINE,
+                     sheet_dir=None):
+    # One member per output of the plan, in plan order. Each source sheet is
+    # serialized once, to a temporary file, and compressed on a pool of threads
+    # while the next sheet is serialized (see parallel_zip); its aliases reuse the
+    # compressed data. Frames are removed from processed_sheets once serialized.
+    # With a profiling.Trace, every serialization, compression and member write is
+    # recorded. Returns the manifest of the package (see manifest.py); with a
+    # base_manifest, only the members that differ from it are written, and the
+    # ZIP is a delta package with its manifest (and delta entry) in it. engine
+    # picks the engine writing the CSV members. With a sheet_dir, every output is
+    # also left there as a loose file named like its member: each sheet is
+    # serialized into the file of its first output rather than a temporary file,
+    # and its aliases are copies of it.
+    from compact import original_dtypes
+
+    ext, write, compression = OUTPUT_FORMATS[output_format]
+    if write is _write_csv:
+        write = get_engine(engine).write_csv
+    manifest = new_manifest(output_format)
+    shapes = {}
+    outputs = {f"{output}{ext}": (output, source) for output, source in plan.items()}
+    sheet_files = {}
+    for name, (_, source) in outputs.items():
+        sheet_files.setdefault(source, name)
+
+    def serialize(source):
+        spool = open(os.path.join(sheet_dir, sheet_files[source]), "w+b") if sheet_dir else tempfile.TemporaryFile()
+        with span(trace, "serialize", sheet=source) as record:
+            df = processed_sheets.pop(source)
+            describe_frame(record, df)
+            shapes[source] = (len(df), list(original_dtypes(df).items()))
+            write(df, spool)
+            del df
+        spool.seek(0)
+        return spool
+
+    changed = []
+
+    def record(name, member):
+        output, source = outputs[name]
+        rows, columns = shapes[source]
+        entry = manifest["sheets"][output] = sheet_entry(name, rows, columns, member.digest)
+        if sheet_changed(output, entry, base_manifest):
+            changed.append(output)
+            return True
+        return False
+
+    members = [(name, source, lambda source=source: serialize(source)) for name, (_, source) in outputs.items()]
+    with ZipWriter(zip_path, compression, compresslevel=compresslevel) as zipw:
+        write_members(zipw, members, workers=workers, trace=trace, keep=record)
+        if base_manifest is not None:
+            zipw.writestr(MANIFEST_MEMBER, dumps_manifest(mark_delta(manifest, base_manifest, changed)))
+    if sheet_dir:
+        for name, (_, source) in outputs.items():
+            if name != sheet_files[source]:
+                shutil.copyfile(os.path.join(sheet_dir, sheet_files[source]), os.path.join(sheet_dir, name))
+    return manifest
+
+
+def write_csv_zip(zip_path, plan, processed_sheets, compresslevel=DEFAULT_COMPRESSLEVEL, engine=DEFAULT_ENGINE):
+    return write_sheets_zip(zip_path, plan, processed_sheets, "csv", compresslevel, engine=engine)
@@ -0,0 +1,251 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import content_hash
+from profiling import span
+
+# ZIP members compressed concurrently. zlib releases the GIL while it deflates, so
+# the members are compressed on a thread pool while the caller serializes the next
+# one, and the compressed data is then appended to a ZipWriter in the order the
+# members were given. Members that share a key (the aliases of a sheet) are
+# compressed once and their data is written for each of them.
+#
+# zipfile.ZipFile cannot take data that is already compressed without going
+# through its private state, which changes between Python versions, so ZipWriter
+# writes the container itself, following the ZIP format (PKWARE APPNOTE.TXT): a
+# local header and the data of every member, then the central directory. The
+# sizes and CRC are known before a member is written, so it needs no data
+# descriptor. ZIP64 fields are only written where a size, an offset or the member
+# count does not fit the classic fields. Every member carries the same fixed
+# timestamp, so the same sheets always give the same ZIP bytes (and the publish
+# step can tell that a package did not change). The archives read back with
+# zipfile and unzip like the ones zipfile writes.
+
+DEFAULT_ZIP_WORKERS = os.cpu_count() or 1
+
+_CHUNK = 1 << 20
+
+# Modification time of every member: the earliest date a ZIP entry can hold
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+# Largest size or offset written without ZIP64 fields (as zipfile: some readers
+# take the classic fields as signed), and largest member count
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+_END_RECORD = struct.Struct("<4s4H2LH")
+_ZIP64_END_RECORD = struct.Struct("<4sQ2H2L4Q")
+_ZIP64_LOCATOR = struct.Struct("<4sLQL")
+
+# Version needed to extract: deflate, and ZIP64 extensions; made by: Unix
+_VERSION = 20
+_ZIP64_VERSION = 45
+_UNIX = 3
+# Bit 11 of the flags: the name is UTF-8
+_UTF8_FLAG = 0x800
+
+
+def _dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (year - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+class CompressedMember:
+    # The compressed data of a member, in a temporary file, with its sizes, CRC
+    # and the content hash of the uncompressed data (as cache.file_digest)
+    def __init__(self, data, crc, file_size, compress_size, digest=None):
+        self.data = data
+        self.crc = crc
+        self.file_size = file_size
+        self.compress_size = compress_size
+        self.digest = digest
+
+    def close(self):
+        self.data.close()
+
+
+def compress_member(source, compression=zipfile.ZIP_DEFLATED, compresslevel=None):
+    # Compress source (a path, or a binary file that is read from its current
+    # position and then closed) the way zipfile would
+    src = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+    out = tempfile.TemporaryFile()
+    compressor = None
+    if compression == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(-1 if compresslevel is None else compresslevel, zlib.DEFLATED, -15)
+    elif compression != zipfile.ZIP_STORED:
+        raise ValueError("only ZIP_DEFLATED and ZIP_STORED members are supported")
+    crc = file_size = 0
+    h = content_hash()
+    try:
+        for chunk in iter(lambda: src.read(_CHUNK), b""):
+            crc = zlib.crc32(chunk, crc)
+            h.update(chunk)
+            file_size += len(chunk)
+            out.write(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            out.write(compressor.flush())
+    except BaseException:
+        out.close()
+        raise
+    finally:
+        src.close()
+    compress_size = out.tell()
+    out.seek(0)
+    return CompressedMember(out, crc, file_size, compress_size, h.hexdigest())
+
+
+class ZipWriter:
+    # A ZIP archive being written to file (a path, or a binary file written from
+    # its current position) with one compression for every member, as
+    # zipfile.ZipFile(file, 'w', compression, compresslevel=compresslevel).
+    # Members are added with write_compressed() or writestr(); close() writes
+    # the central directory.
+    def __init__(self, file, compression=zipfile.ZIP_DEFLATED, compresslevel=None):
+        if compression not in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+            raise ValueError("only ZIP_DEFLATED and ZIP_STORED archives are supported")
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self._own = isinstance(file, (str, os.PathLike))
+        self._file = open(file, 'wb') if self._own else file
+        self._offset = 0
+        self._entries = []
+        self._names = set()
+
+    def _write(self, data):
+        self._file.write(data)
+        self._offset += len(data)
+
+    def write_compressed(self, name, member):
+        # Append a member compressed by compress_member with this archive's
+        # compression
+        if name in self._names:
+            raise ValueError(f"duplicate member {name}")
+        self._names.add(name)
+        try:
+            encoded, flags = name.encode("ascii"), 0
+        except UnicodeEncodeError:
+            encoded, flags = name.encode("utf-8"), _UTF8_FLAG
+        date, time = _dos_date_time(ZIP_DATE_TIME)
+        zip64 = member.file_size > ZIP64_LIMIT or member.compress_size > ZIP64_LIMIT
+        extra = struct.pack("<2H2Q", 1, 16, member.file_size, member.compress_size) if zip64 else b""
+        offset = self._offset
+        self._write(_LOCAL_HEADER.pack(
+            b"PK\x03\x04", _ZIP64_VERSION if zip64 else _VERSION, flags, self.compression, time, date, member.crc,
+            0xFFFFFFFF if zip64 else member.compress_size, 0xFFFFFFFF if zip64 else member.file_size,
+            len(encoded), len(extra)) + encoded + extra)
+        member.data.seek(0)
+        shutil.copyfileobj(member.data, self._file, _CHUNK)
+        self._offset += member.compress_size
+        self._entries.append((encoded, flags, member.crc, member.file_size, member.compress_size, offset))
+
+    def writestr(self, name, data):
+        # Add a member holding data (bytes)
+        member = compress_member(io.BytesIO(data), self.compression, self.compresslevel)
+        try:
+            self.write_compressed(name, member)
+        finally:
+            member.close()
+
+    def _write_directory(self):
+        start = self._offset
+        date, time = _dos_date_time(ZIP_DATE_TIME)
+        for encoded, flags, crc, file_size, compress_size, offset in self._entries:
+            # The ZIP64 extra field holds the values that do not fit, in this order
+            large = [value for value in (file_size, compress_size, offset) if value > ZIP64_LIMIT]
+            extra = struct.pack(f"<2H{len(large)}Q", 1, 8 * len(large), *large) if large else b""
+            version = _ZIP64_VERSION if large else _VERSION
+            self._write(_CENTRAL_HEADER.pack(
+                b"PK\x01\x02", _UNIX << 8 | version, version, flags, self.compression, time, date, crc,
+                0xFFFFFFFF if compress_size > ZIP64_LIMIT else compress_size,
+                0xFFFFFFFF if file_size > ZIP64_LIMIT else file_size,
+                len(encoded), len(extra), 0, 0, 0, 0o600 << 16,
+                0xFFFFFFFF if offset > ZIP64_LIMIT else offset) + encoded + extra)
+        count, size = len(self._entries), self._offset - start
+        if count > ZIP_FILECOUNT_LIMIT or size > ZIP64_LIMIT or start > ZIP64_LIMIT:
+            end64 = self._offset
+            self._write(_ZIP64_END_RECORD.pack(b"PK\x06\x06", _ZIP64_END_RECORD.size - 12, _ZIP64_VERSION,
+                                               _ZIP64_VERSION, 0, 0, count, count, size, start))
+            self._write(_ZIP64_LOCATOR.pack(b"PK\x06\x07", 0, end64, 1))
+            count, size, start = min(count, 0xFFFF), min(size, 0xFFFFFFFF), min(start, 0xFFFFFFFF)
+        self._write(_END_RECORD.pack(b"PK\x05\x06", 0, 0, count, count, size, start, 0))
+
+    def close(self, complete=True):
+        # Write the central directory (unless complete is False) and close the
+        # file if this writer opened it
+        if self._file is None:
+            return
+        try:
+            if complete:
+                self._write_directory()
+            self._file.flush()
+        finally:
+            if self._own:
+                self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
+
+
+def write_members(zipw, members, workers=DEFAULT_ZIP_WORKERS, trace=None, keep=None):
+    # members: [(name, key, produce)] in archive order. produce() returns the data
+    # of the member, as a path or a binary file, and is called on this thread, in
+    # order, once per key. At most workers members are compressed (or waiting to
+    # be written) at a time. keep(name, member) is called with every compressed
+    # member before it is written, in archive order, and can leave it out by
+    # returning False. With a profiling.Trace, every compression and every member
+    # write is recorded.
+    members = list(members)
+    remaining = {}
+    for _, key, _ in members:
+        remaining[key] = remaining.get(key, 0) + 1
+
+    def compress(key, source):
+        with span(trace, "deflate", sheet=key) as record:
+            member = compress_member(source, zipw.compression, zipw.compresslevel)
+            record["bytes"] = member.compress_size
+        return member
+
+    def write_next():
+        name, key, _ = members[written]
+        member = compressed[key].result()
+        if keep is None or keep(name, member):
+            with span(trace, "zip", sheet=name) as record:
+                zipw.write_compressed(name, member)
+                record["bytes"] = member.file_size
+        remaining[key] -= 1
+        if not remaining[key]:
+            compressed.pop(key).result().close()
+
+    compressed, written = {}, 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for name, key, produce in members:
+                if key in compressed or not remaining[key]:
+                    continue
+                # Write what is ready, and wait for the oldest member when the
+                # pool is full, so only a bounded number of members is spooled
+                while written < len(members) and (
+                        members[written][1] in compressed
+                        and (compressed[members[written][1]].done() or len(compressed) >= max(1, workers))):
+                    write_next()
+                    written += 1
+                compressed[key] = pool.submit(compress, key, produce())
+            while written < len(members):
+                write_next()
+                written += 1
+    finally:
+        for future in compressed.values():
+            if future.done() and not future.exception():
+                future.result().close()
@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import sys
+import zipfile
+
+from cache import DEFAULT_CACHE_DIR, SheetCache
+from compact import compact_frame
+from engines import DEFAULT_ENGINE, ENGINES
+from extraction import DEFAULT_WORKERS, extract_all
+from incremental import MergeState, upload_keys
+from manifest import apply_delta, delta_filename, full_manifest, load_manifest, manifest_path, write_manifest
+from outputs import OUTPUT_FILENAMES, OUTPUT_FORMATS, write_sheets_zip
+from profiling import Trace, describe_frame, span
+from schemas import schema_for
+from sheet_plan import build_sheet_plan, source_sheets
+from spill import SpillArea, SpilledSheets
+from workbook_index import plan_reads
+
+# The LOB/reinsurance pipeline shared by the Streamlit app (transform.py) and the
+# command line: read the workbooks, merge every sheet across files, apply the
+# sheet cleanups and write the output ZIP. Nothing here imports Streamlit, so
+# batch jobs run the same engine without it:
+#
+#   python pipeline.py run --lob lob --reinsurance reinsurance --out processed_sheets.zip
+
+WORKBOOK_EXTENSIONS = (".xlsx", ".xlsb")
+
+
+def discover_workbooks(folder):
+    # The workbooks of a folder, sorted so that the merge order is reproducible
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if name.lower().endswith(WORKBOOK_EXTENSIONS)]
+
+
+def clean_sheet(sheet, df):
+    # Sheet-specific cleanups applied to the merged sheets before writing: the
+    # columns the sheet's schema drops (already left out when the sheets were
+    # read with normalization)
+    schema = schema_for(sheet)
+    dropped = [column for column in df.columns if schema and not schema.usecols(column)]
+    if dropped:
+        df = df.drop(columns=dropped)
+    return df
+
+
+class PipelineRun:
+    # One run over a list of workbooks (uploads or paths), step by step so that a
+    # caller can report between the steps: plan_reads(), read(), merge(), then
+    # write(). Passing the MergeState of an earlier run only reads the workbooks
+    # that are not merged in it yet. With spill=True the per-file sheets are kept
+    # on disk (under spill_dir, default the temp folder) and each sheet is merged
+    # only when it is written, which bounds memory by the largest merged sheet; the
+    # merge state is not kept then. With compact=True the merged sheets are
+    # compacted (see compact.py) and restored when written; this only pays off
+    # for a caller that keeps the merge state between runs, as the app does, and
+    # otherwise costs two copies of every sheet. engine names the
+    # engine writing the CSV members (see engines.py). With clean=False the
+    # sheet cleanups (clean_sheet) are skipped. close() removes the spill area.
+    def __init__(self, files, plan=None, state=None, normalize=True, trace=None, spill=False, spill_dir=None,
+                 compact=False, engine=DEFAULT_ENGINE, clean=True):
+        self.files = list(files)
+        self.plan = plan if plan is not None else build_sheet_plan()
+        self.sheets = source_sheets(self.plan)
+        self.normalize = normalize
+        self.compact = compact
+        self.engine = engine
+        self.clean = clean
+        self.trace = trace if trace is not None else Trace()
+        self.spill = SpillArea(spill_dir) if spill else None
+        self.keys = upload_keys(self.files)
+        if spill or state is None or state.sheets != self.sheets:
+            state = MergeState(self.sheets)
+        self.state = state
+        self.new_files = [(key, file) for key, file in zip(self.keys, self.files) if key not in state.keys]
+        self.removed = len(set(state.keys) - set(self.keys))
+        self.read_plan = None
+        self.results = []
+        self.errors = []
+        self.cache_hits = self.cache_misses = 0
+        self.spilled = {}
+        self.manifest = None
+
+    @property
+    def files_to_read(self):
+        return [file for _, file in self.new_files]
+
+    def plan_reads(self):
+        # The sheets each new workbook contains, from the workbook manifests
+        self.read_plan = plan_reads(self.files_to_read, self.sheets)
+        return self.read_plan
+
+    def read(self, workers=DEFAULT_WORKERS, cache_dir=None, on_result=None, preparsed=None, executor=None):
+        # Read every new workbook once, spread over a pool of worker processes
+        # (executor, or a pool of the run's own). preparsed maps upload keys to
+        # WorkbookResults already read in the background (see preparse.py); those
+        # workbooks are not read again.
+        if self.read_plan is None:
+            self.plan_reads()
+        preparsed = {} if preparsed is None or self.spill else preparsed
+        pending = [i for i, (key, _) in enumerate(self.new_files) if key not in preparsed]
+        done = len(self.new_files) - len(pending)
+        results = extract_all([self.new_files[i][1] for i in pending], self.sheets, workers=workers,
+                              normalize=self.normalize, cache_dir=cache_dir,
+                              read_plan=[self.read_plan[i] for i in pending],
+                              on_result=on_result and (lambda n, total: on_result(done + n, done + total)),
+                              spill_dir=self.spill.directory if self.spill else None, executor=executor)
+        results = dict(zip(pending, results))
+        self.results = [results[i] if i in results else preparsed[key] for i, (key, _) in enumerate(self.new_files)]
+        for result in self.results:
+            self.trace.extend(result.spans)
+            self.errors.extend(result.errors)
+            self.cache_hits += result.cache_hits
+            self.cache_misses += result.cache_misses
+        return self.results
+
+    def merge(self):
+        # Merge in the original file order; the per-file frames are released. In
+        # spill mode the sheets are merged from disk as they are written instead.
+        if self.spill:
+            self.spilled = {sheet: [result.frames[sheet] for result in self.results if sheet in result.frames]
+                            for sheet in self.sheets}
+            self.results = []
+            return None
+        self.state.update(self.keys, {key: result.frames for (key, _), result in zip(self.new_files, self.results)},
+                          trace=self.trace)
+        self.results = []
+        if self.compact:
+            for sheet, df in self.state.merged.items():
+                with span(self.trace, "compact", sheet=sheet) as record:
+                    self.state.merged[sheet] = df = compact_frame(df)
+                    describe_frame(record, df)
+        return self.state.merged
+
+    def take_processed_sheets(self):
+        # The cleaned sheets to write. The run drops its reference to the merge
+        # state, so each sheet is freed once written unless the caller kept it.
+        finish = clean_sheet if self.clean else (lambda sheet, df: df)
+        if self.spill:
+            return SpilledSheets(self.spilled, finish=finish)
+        processed = {sheet: finish(sheet, df) for sheet, df in self.state.merged.items()}
+        self.state = None
+        return processed
+
+    def write(self, zip_path, processed_sheets, output_format="csv", compresslevel=None, base_manifest=None,
+              sheet_dir=None):
+        # Write the package and, next to it, the manifest of the full package.
+        # With the manifest of an earlier package, the ZIP only holds the sheets
+        # that changed since (a delta package, see manifest.py). With a sheet_dir,
+        # every output sheet is also written there as a loose file. Returns the
+        # manifest, with its delta entry for a delta package.
+        self.manifest = write_sheets_zip(zip_path, self.plan, processed_sheets, output_format,
+                                         compresslevel=compresslevel, trace=self.trace, base_manifest=base_manifest,
+                                         engine=self.engine, sheet_dir=sheet_dir)
+        write_manifest(manifest_path(zip_path), full_manifest(self.manifest))
+        return self.manifest
+
+    def close(self):
+        if self.spill:
+            self.spill.cleanup()
+
+
+def run(files, zip_path, output_format="csv", copy_groups=False, normalize=True, workers=DEFAULT_WORKERS,
+        compresslevel=None, cache_dir=None, on_result=None, spill=False, spill_dir=None, compact=False,
+        base_manifest=None, engine=DEFAULT_ENGINE, clean=True, sheet_dir=None):
+    # The whole pipeline in one call; returns the finished PipelineRun
+    pipeline = PipelineRun(files, build_sheet_plan(copy_groups=copy_groups), normalize=normalize, spill=spill,
+                           spill_dir=spill_dir, compact=compact, engine=engine, clean=clean)
+    try:
+        pipeline.read(workers=workers, cache_dir=cache_dir, on_result=on_result)
+        pipeline.merge()
+        pipeline.write(zip_path, pipeline.take_processed_sheets(), output_format, compresslevel,
+                       base_manifest=base_manifest, sheet_dir=sheet_dir)
+    finally:
+        pipeline.close()
+    return pipeline
+
+
+parser = argparse.ArgumentParser(prog="lobs-reserves", description="LOB & reinsurance workbook processor")
+subparsers = parser.add_subparsers(dest="command", required=True)
+run_parser = subparsers.add_parser("run", help="merge the LOB and reinsurance workbooks into one ZIP")
+run_parser.add_argument("--lob", metavar="DIR", help="folder of Line of Business workbooks (.xlsx/.xlsb)")
+run_parser.add_argument("--reinsurance", metavar="DIR", help="folder of reinsurance workbooks (.xlsx/.xlsb)")
+run_parser.add_argument("--out", help="output ZIP (default: Dodo_results/ and the format's file name)")
+run_parser.add_argument("--format", choices=list(OUTPUT_FORMATS), default="csv",
+                        help="output format: CSV files (default) or one Parquet file per sheet")
+run_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"number of worker processes used to read workbooks (default: {DEFAULT_WORKERS})")
+run_parser.add_argument("--compression-level", type=int, choices=range(10), default=None, metavar="0-9",
+                        help="zlib compression level of the ZIP members (default: 6)")
+run_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"cache of parsed sheets, keyed by workbook content (default: {DEFAULT_CACHE_DIR})")
+run_parser.add_argument("--no-cache", action="store_true", help="parse every workbook without using the cache")
+run_parser.add_argument("--copy-groups", action="store_true",
+                        help="write groups 2-4 as copies of their first sheet (as matt.py does)")
+run_parser.add_argument("--no-normalize", action="store_true",
+                        help="keep the columns as read instead of normalizing mostly-numeric columns")
+run_parser.add_argument("--no-clean", action="store_true",
+                        help="keep the columns the sheet cleanups drop; with --copy-groups and --no-normalize "
+                             "this is the matt.py output")
+run_parser.add_argument("--engine", choices=list(ENGINES), default=DEFAULT_ENGINE,
+                        help="engine writing the CSV files (reading and merging use pandas with either); arrow "
+                             f"formats them on several threads and writes the same bytes (default: {DEFAULT_ENGINE})")
+run_parser.add_argument("--spill", action="store_true",
+                        help="keep the per-file sheets on disk and merge one sheet at a time (very large runs)")
+run_parser.add_argument("--spill-dir", default=None,
+                        help="where the spill area is created (default: the temporary folder)")
+run_parser.add_argument("--delta-from", metavar="MANIFEST",
+                        help="write a delta package with only the sheets that changed since this manifest (the "
+                             ".manifest.json written next to an earlier package, or a delta package)")
+run_parser.add_argument("--trace", metavar="FILE", help="write the per-stage timings as a Chrome trace JSON")
+apply_parser = subparsers.add_parser("apply-delta", help="rebuild a full package from an earlier one and a delta")
+apply_parser.add_argument("base", help="the full package the delta was made against")
+apply_parser.add_argument("delta", help="the delta package")
+apply_parser.add_argument("--out", required=True, help="the full package to write")
+apply_parser.add_argument("--compression-level", type=int, choices=range(10), default=None, metavar="0-9",
+                          help="zlib compression level of the ZIP members (default: 6)")
+
+
+def apply_delta_command(args):
+    try:
+        manifest = apply_delta(args.base, args.delta, args.out, compresslevel=args.compression_level)
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Applied {len(load_manifest(args.delta)['delta']['sheets'])} changed sheets; "
+          f"{len(manifest['sheets'])} sheets saved in {args.out}")
+    return 0
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    if args.command == "apply-delta":
+        return apply_delta_command(args)
+    files = []
+    for folder in (args.lob, args.reinsurance):
+        if folder:
+            files += discover_workbooks(folder)
+    if not files:
+        parser.error("no workbooks found; pass --lob and/or --reinsurance folders with .xlsx/.xlsb files")
+
+    base_manifest = None
+    if args.delta_from:
+        try:
+            base_manifest = load_manifest(args.delta_from)
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"--delta-from {args.delta_from} is not a package manifest: {e}")
+    zip_name = OUTPUT_FILENAMES[args.format]
+    out = args.out or os.path.join("Dodo_results", delta_filename(zip_name) if base_manifest else zip_name)
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    cache_dir = None if args.no_cache else args.cache_dir
+
+    pipeline = run(files, out, args.format, copy_groups=args.copy_groups, normalize=not args.no_normalize,
+                   clean=not args.no_clean,
+                   workers=args.workers, compresslevel=args.compression_level, cache_dir=cache_dir,
+                   spill=args.spill, spill_dir=args.spill_dir,
+                   engine=args.engine,
+                   base_manifest=base_manifest,
+                   on_result=lambda done, total: print(f"Read {done}/{total} workbooks", file=sys.stderr))
+    for error in pipeline.errors:
+        print(error, file=sys.stderr)
+    if cache_dir:
+        try:
+            SheetCache(cache_dir).evict()
+        except OSError as e:
+            print(f"Parse cache unavailable: {e}", file=sys.stderr)
+        print(f"Parse cache: {pipeline.cache_hits} hits, {pipeline.cache_misses} misses", file=sys.stderr)
+    if args.trace:
+        with open(args.trace, "w") as f:
+            json.dump(pipeline.trace.chrome_trace(), f)
+    if base_manifest is not None:
+        print(f"Delta package: {len(pipeline.manifest['delta']['sheets'])} of "
+              f"{len(pipeline.manifest['sheets'])} sheets changed", file=sys.stderr)
+    print(f"ZIP file saved in {out}")
+    return 1 if pipeline.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+from concurrent.futures.process import BrokenProcessPool
+
+from extraction import read_workbook, workbook_source
+
+# Background parsing of uploads: every workbook is submitted to a process pool as
+# soon as it is selected, so by the time "Generate All" is clicked most of them
+# are already read and the run only merges and writes. jobs maps an upload key
+# (incremental.upload_keys) to the Future of its WorkbookResult. jobs lives in the
+# session state and is only touched by the script thread: a run gets its Futures
+# handed over with take_jobs() when it is submitted, and the entry is kept as None
+# so the file is not submitted again. The pool is the one the runs read the rest
+# of the workbooks on, so background parses and runs share its workers. When a
+# worker process dies (e.g. killed for running out of memory) the pool is broken:
+# every job on it fails with BrokenProcessPool and submitting raises it, so the
+# caller replaces the pool and the jobs it lost are submitted again.
+
+STATUS_ICONS = {"parsing": "⏳", "ready": "✅", "failed": "❌", "used": "✅"}
+
+
+def start_preparse(executor, jobs, keys, files, sheets, normalize=True, skiprows=8, cache_dir=None):
+    # Submit the files that have no job yet, or whose job was lost with a broken
+    # pool, and drop the jobs of files that are no longer selected. Raises
+    # BrokenProcessPool if executor is broken.
+    release_jobs(jobs, keys)
+    for key, file in zip(keys, files):
+        if key not in jobs or lost_to_broken_pool(jobs[key]):
+            jobs[key] = executor.submit(read_workbook, workbook_source(file), sheets, normalize, skiprows, cache_dir)
+    return jobs
+
+
+def release_jobs(jobs, keys=()):
+    # Cancel and drop the jobs of every file not in keys (all of them by default),
+    # so the results of deselected files are freed
+    for key in set(jobs) - set(keys):
+        job = jobs.pop(key)
+        if job is not None:
+            job.cancel()
+    return jobs
+
+
+def lost_to_broken_pool(job):
+    # Whether a job failed because a worker of its pool died
+    return (job is not None and job.done() and not job.cancelled()
+            and isinstance(job.exception(), BrokenProcessPool))
+
+
+def job_status(job):
+    # "parsing", "ready", "failed", or "used" for a job already taken by a run
+    if job is None:
+        return "used"
+    if not job.done():
+        return "parsing"
+    if job.cancelled() or job.exception() is not None or job.result().errors:
+        return "failed"
+    return "ready"
+
+
+def take_jobs(jobs, keys):
+    # Hand the jobs of the given keys over to a run: {key: Future}. The jobs are
+    # marked as used, so the session no longer holds their results.
+    taken = {}
+    for key in keys:
+        job = jobs.get(key)
+        if job is not None:
+            taken[key] = job
+            jobs[key] = None
+    return taken
+
+
+def collect_results(taken, keys):
+    # {key: WorkbookResult} for the given keys among the jobs taken by take_jobs,
+    # waiting for the jobs still running. A job that crashed or was cancelled is
+    # left out so its file is read again by the run.
+    results = {}
+    for key in keys:
+        job = taken.pop(key, None)
+        if job is None:
+            continue
+        try:
+            results[key] = job.result()
+        except Exception:
+            pass
+    return results
@@ -0,0 +1,89 @@
+import os
+import time
+from contextlib import contextmanager
+
+# Per-stage instrumentation of a run. Every (file, sheet) read and normalization,
+# every sheet merge and every ZIP member write is recorded as a span: wall time,
+# rows, columns, bytes and the change in resident memory. Spans are plain dicts so
+# the worker processes can return them with their WorkbookResult, and they carry
+# wall-clock start times so spans from different processes line up on one
+# timeline.
+
+SPAN_COLUMNS = ["stage", "file", "sheet", "start", "seconds", "rows", "columns", "bytes", "memory_delta", "pid"]
+
+
+def _rss():
+    # Resident memory of this process in bytes; None when psutil is not installed
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def describe_frame(record, df):
+    # Fill in the size fields of a span from the frame it produced
+    record["rows"], record["columns"] = df.shape
+    record["bytes"] = int(df.memory_usage(index=False).sum())
+
+
+class Trace:
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def span(self, stage, file=None, sheet=None):
+        # Yields the span record so the caller can fill in rows, columns and bytes
+        record = {"stage": stage, "file": file, "sheet": sheet, "rows": None, "columns": None, "bytes": None}
+        rss_before = _rss()
+        record["start"] = time.time()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - started
+            rss_after = _rss()
+            record["memory_delta"] = None if rss_before is None or rss_after is None else rss_after - rss_before
+            record["pid"] = os.getpid()
+            self.spans.append(record)
+
+    def extend(self, spans):
+        self.spans.extend(spans)
+
+    def to_frame(self):
+        # One row per span, start in seconds from the first span
+        import pandas as pd
+
+        df = pd.DataFrame(self.spans, columns=SPAN_COLUMNS)
+        if not df.empty:
+            df["start"] -= df["start"].min()
+        return df
+
+    def chrome_trace(self):
+        # Trace Event Format, loadable in chrome://tracing and Perfetto. Every
+        # process is a track and every stage a thread within it.
+        origin = min((span["start"] for span in self.spans), default=0)
+        stages = {}
+        events = []
+        for span in self.spans:
+            tid = stages.setdefault(span["stage"], len(stages))
+            name = " / ".join(str(part) for part in (span["stage"], span["file"], span["sheet"]) if part is not None)
+            args = {key: span[key] for key in ("file", "sheet", "rows", "columns", "bytes", "memory_delta")
+                    if span[key] is not None}
+            events.append({"name": name, "cat": span["stage"], "ph": "X", "pid": span["pid"], "tid": tid,
+                           "ts": round((span["start"] - origin) * 1e6), "dur": round(span["seconds"] * 1e6),
+                           "args": args})
+        for stage, tid in stages.items():
+            for pid in {span["pid"] for span in self.spans}:
+                events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": stage}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+@contextmanager
+def span(trace, stage, file=None, sheet=None):
+    # Trace.span that accepts trace=None, for the code paths that run untraced
+    if trace is None:
+        yield {}
+    else:
+        with trace.span(stage, file, sheet) as record:
+            yield record
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+
+# Publishing of the output ZIP to the GitHub repository. The upload runs on a
+# background thread so the app serves the download as soon as the ZIP exists, and
+# it is skipped when the file in the repository already has the same content.
+# repo is anything with the get_contents/create_file/update_file methods of
+# github.Repository, so a local fake can stand in for GitHub. PublishJob also
+# accepts a function returning the repo, so connecting to GitHub happens on the
+# background thread too.
+
+# One upload at a time per process, so two runs never race on the same file's sha
+_publish_lock = threading.Lock()
+
+
+def git_blob_sha(data):
+    # The sha GitHub reports for a file: the git blob hash of its content
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _is_missing(error):
+    # Whether get_contents failed because the file does not exist. The exception
+    # is matched by name so that PyGithub is only imported by the app.
+    return type(error).__name__ == "UnknownObjectException" or getattr(error, "status", None) == 404
+
+
+def publish_file(repo, path, data, branch="main"):
+    # Create or update path on branch. Returns "created", "updated" or, when the
+    # file already holds data, "unchanged" without uploading anything.
+    try:
+        contents = repo.get_contents(path, ref=branch)
+    except Exception as e:
+        # PyGithub raises UnknownObjectException (status 404) for a missing file;
+        # any other failure (API errors, connection errors, timeouts) is raised
+        if not _is_missing(e):
+            raise
+        contents = None
+
+    if contents is None:
+        repo.create_file(path, f"Create {path}", data, branch=branch)
+        return "created"
+    if contents.sha == git_blob_sha(data):
+        return "unchanged"
+    repo.update_file(path, f"Update {path}", data, contents.sha, branch=branch)
+    return "updated"
+
+
+class PublishJob:
+    # publish_file on a background thread; status is "pending", "uploading", then
+    # the result of publish_file or "failed" (with the exception in error)
+    FINISHED = ("created", "updated", "unchanged", "failed")
+
+    def __init__(self, repo, path, data, branch="main"):
+        self.path = path
+        self.branch = branch
+        self.status = "pending"
+        self.error = None
+        self._thread = threading.Thread(target=self._run, args=(repo, data), daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self, repo, data):
+        with _publish_lock:
+            self.status = "uploading"
+            try:
+                if callable(repo):
+                    repo = repo()
+                self.status = publish_file(repo, self.path, data, self.branch)
+            except Exception as e:
+                self.error = e
+                self.status = "failed"
+
+    @property
+    def done(self):
+        return self.status in self.FINISHED
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return self.done
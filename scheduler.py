@@ -0,0 +1,154 @@
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+# Process-wide scheduling of "Generate All" runs. Streamlit runs every session's
+# script in its own thread, so without this each click starts a full parse that
+# competes with every other session for CPU and memory. Jobs go through one queue
+# served by a bounded number of worker threads; a job submitted with the key of a
+# job that is queued, running or finished less than ttl seconds ago shares that
+# job instead of computing the same result again, unless the job failed or was
+# marked as not shareable.
+
+DEFAULT_JOB_WORKERS = int(os.environ.get("LOBS_JOB_WORKERS", "1"))
+DEFAULT_JOB_TTL = float(os.environ.get("LOBS_JOB_TTL_SECONDS", "3600"))
+
+_job_ids = itertools.count(1)
+
+
+class Job:
+    # One scheduled run. fn(job, *args, **kwargs) runs on a worker thread and
+    # reports through set_progress() and report(); its return value becomes
+    # result. status goes "queued", "running", then "done" or "failed" (with the
+    # exception in error). fn can set shareable to False when its result is
+    # incomplete (e.g. some workbooks could not be read), so that the next
+    # submit with the same key runs again instead of reusing it. Files listed in
+    # temp_paths are removed when the job expires.
+    FINISHED = ("done", "failed")
+
+    def __init__(self, key, fn, args, kwargs):
+        self.id = next(_job_ids)
+        self.key = key
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.progress = (0.0, "")
+        self.messages = []
+        self.temp_paths = []
+        self.shareable = True
+        self.submitted = time.time()
+        self.finished = None
+        self._call = (fn, args, kwargs)
+        self._finished = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in self.FINISHED
+
+    def wait(self, timeout=None):
+        self._finished.wait(timeout)
+        return self.done
+
+    def set_progress(self, value, text=""):
+        self.progress = (value, text)
+
+    def report(self, kind, text):
+        # A message for the sessions showing the job, e.g. ("error", "...")
+        self.messages.append((kind, text))
+
+    def _run(self):
+        fn, args, kwargs = self._call
+        self._call = None
+        self.status = "running"
+        try:
+            self.result = fn(self, *args, **kwargs)
+            status = "done"
+        except Exception as e:
+            self.error = e
+            status = "failed"
+        self.finished = time.time()
+        self.status = status
+        self._finished.set()
+
+    def _discard(self):
+        for path in self.temp_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.temp_paths = []
+        self.result = None
+
+
+class JobScheduler:
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, ttl=DEFAULT_JOB_TTL):
+        self.workers = max(1, workers)
+        self.ttl = ttl
+        self._jobs = {}
+        self._queue = deque()
+        self._replaced = []
+        self._lock = threading.Condition()
+        self._threads = []
+
+    def submit(self, key, fn, *args, **kwargs):
+        # Returns (job, created): the job computing key, and whether this call
+        # created it. A failed job, or a finished one that is not shareable, is
+        # not shared, so submitting again retries. The result of a replaced job
+        # stays available to the sessions showing it until it expires.
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(key)
+            if job is not None:
+                if job.status != "failed" and (job.shareable or not job.done):
+                    return job, False
+                if job.status == "failed":
+                    job._discard()
+                else:
+                    self._replaced.append(job)
+            job = self._jobs[key] = Job(key, fn, args, kwargs)
+            self._queue.append(job)
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, daemon=True, name=f"lobs-job-{len(self._threads)}")
+                self._threads.append(thread)
+                thread.start()
+            self._lock.notify()
+        return job, True
+
+    def position(self, job):
+        # 1-based place of a queued job in the queue, None once it has started
+        with self._lock:
+            for i, queued in enumerate(self._queue, start=1):
+                if queued is job:
+                    return i
+        return None
+
+    def queued(self):
+        with self._lock:
+            return len(self._queue)
+
+    def expired(self, job):
+        # Whether a finished job's result has been dropped
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job.key) is not job and job not in self._replaced
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._lock.wait()
+                job = self._queue.popleft()
+            job._run()
+
+    def _expire(self):
+        # Drop the jobs that finished more than ttl seconds ago (caller holds the lock)
+        now = time.time()
+        for key, job in list(self._jobs.items()):
+            if job.done and now - job.finished > self.ttl:
+                del self._jobs[key]
+                job._discard()
+        for job in [job for job in self._replaced if now - job.finished > self.ttl]:
+            self._replaced.remove(job)
+            job._discard()
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_string_dtype
+
+# Declared column types of the known LOB/reinsurance sheets. A sheet with a schema
+# is read straight into its types: text columns (IDs, names, curve references) are
+# read as strings and never coerced, number columns are made numeric with blanks as
+# 0, and the dropped columns are not read at all. Only sheets without a schema go
+# through the mostly-numeric inference of normalize.py.
+
+TEXT = "text"
+NUMBER = "number"
+
+
+def _as_text(series):
+    # Strings with the blanks kept missing, as dtype=str in the Excel readers
+    return series.astype(str).where(series.notna(), np.nan)
+
+
+class SheetSchema:
+    # text and number name the columns of each type; every other column has the
+    # default type. drop lists the columns that are left out when reading.
+    def __init__(self, text=(), number=(), default=NUMBER, drop=()):
+        self.types = {**dict.fromkeys(number, NUMBER), **dict.fromkeys(text, TEXT)}
+        self.default = default
+        self.drop = frozenset(drop)
+
+    def column_type(self, column):
+        return self.types.get(str(column), self.default)
+
+    def usecols(self, column):
+        return str(column) not in self.drop
+
+    def read_options(self):
+        # usecols and dtype for WorkbookSession.read; the default type is applied
+        # by apply() as the column names are only known once the sheet is read
+        return {"usecols": self.usecols,
+                "dtype": {column: str for column, kind in self.types.items() if kind == TEXT}}
+
+    def apply(self, df):
+        # Bring a read sheet to the declared types, without inspecting the values
+        # of text columns beyond their dtype. The numeric columns the reader already
+        # typed are handled in one block, as the cash-flow sheets have over a
+        # thousand of them.
+        dropped = [column for column in df.columns if not self.usecols(column)]
+        if dropped:
+            df = df.drop(columns=dropped)
+        typed = []
+        for column, dtype in df.dtypes.items():
+            if self.column_type(column) == TEXT:
+                if not is_string_dtype(df[column]):
+                    df[column] = _as_text(df[column])
+            elif dtype.kind in "fc":
+                typed.append(column)
+            elif dtype.kind not in "ibmM":
+                df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0)
+        if typed:
+            blanks = df[typed].isna().any()
+            filled = blanks.index[blanks].tolist()
+            if filled:
+                df[filled] = df[filled].fillna(0)
+        return df
+
+
+_GOC_VARIABLE = SheetSchema(text=["GOC_ID", "VARIABLE_NAME"])
+
+SCHEMAS = {
+    "ACTUALS_FOR_VISUALIZATION": _GOC_VARIABLE,
+    "ACTUARIAL_AOM_IMPACT": SheetSchema(text=["GOC_ID", "STEP_ID"], drop=["* MACRO_STEP_ID_DESCRIPTION"]),
+    "CURVE_ID_PARAM": SheetSchema(default=TEXT),
+    "INITIALIZATION": SheetSchema(text=["GOC_ID"]),
+    "MANDATORY_ACTUALS": _GOC_VARIABLE,
+    "MP_GOC": SheetSchema(number=["ANNUAL_COHORT", "SHARE_TECH_EXP_ENTITY_SHARE", "GOC_DURATION"], default=TEXT),
+    "MP_GOC_SEG": SheetSchema(text=["GOC_SEG_ID", "GOC_ID", "SEG_ID"]),
+    "OCI_OPTION_DERECOG": _GOC_VARIABLE,
+}
+
+# Every cash-flow sheet (CF_T1_PVFC_LIC_CLO, ..._OP_FADJ_PY, ...) has the GOC and
+# variable name followed by the PV and one column per projection period
+SCHEMA_PREFIXES = {
+    "CF_T1_PVFC_LIC_": _GOC_VARIABLE,
+}
+
+
+def schema_for(sheet):
+    # The schema of a sheet, None for a sheet that is not known
+    if sheet in SCHEMAS:
+        return SCHEMAS[sheet]
+    for prefix, schema in SCHEMA_PREFIXES.items():
+        if sheet.startswith(prefix):
+            return schema
+    return None
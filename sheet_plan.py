@@ -0,0 +1,31 @@
+# Sheet groups
+GROUP1_SHEETS = ["ACTUALS_FOR_VISUALIZATION", "ACTUARIAL_AOM_IMPACT", "CF_T1_PVFC_LIC_CLO",
+                 "CF_T1_PVFC_LIC_INCEXP_LIC_INCR", "CF_T1_PVFC_LIC_INCLAIM_LIC_INCR", "CURVE_ID_PARAM",
+                 "INITIALIZATION", "MANDATORY_ACTUALS", "MP_GOC", "MP_GOC_SEG", "OCI_OPTION_DERECOG",
+                 "CF_T1_PVFC_LIC_CLO_FADJ_PY", "CF_T1_PVFC_LIC_OP", "CF_T1_PVFC_LIC_TEXPVAR_PY"]
+GROUP2_SHEETS = ["CF_T1_PVFC_LIC_CLO_FADJ_PY", "CF_T1_PVFC_LIC_CLO_TADJ_PY", "CF_T1_PVFC_LIC_DEREC",
+                 "CF_T1_PVFC_LIC_EXPCLO_PY"]
+GROUP3_SHEETS = ["CF_T1_PVFC_LIC_OP", "CF_T1_PVFC_LIC_OP_FADJ_PY", "CF_T1_PVFC_LIC_OP_TADJ_PY"]
+GROUP4_SHEETS = ["CF_T1_PVFC_LIC_TEXPVAR_PY", "CF_T1_PVFC_LIC_TASSCHG_PY", "CF_T1_PVFC_LIC_FASSCHG_PY",
+                 "CF_T1_PVFC_LIC_FEXPVAR_PY"]
+
+COPY_GROUPS = [GROUP2_SHEETS, GROUP3_SHEETS, GROUP4_SHEETS]
+
+
+def build_sheet_plan(copy_groups=False):
+    # Declarative plan of the output sheets: {output sheet: source sheet}, in output
+    # order. Sheets listed in more than one group appear once. With copy_groups,
+    # every sheet of groups 2-4 is an alias of its group's first sheet (the
+    # matt.py / transform2.py behaviour); otherwise each sheet is its own source.
+    plan = {}
+    for sheet in GROUP1_SHEETS:
+        plan.setdefault(sheet, sheet)
+    for group in COPY_GROUPS:
+        for sheet in group:
+            plan.setdefault(sheet, group[0] if copy_groups else sheet)
+    return plan
+
+
+def source_sheets(plan):
+    # The distinct sheets that have to be read and merged, in plan order
+    return list(dict.fromkeys(plan.values()))
@@ -0,0 +1,90 @@
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from merge import merge_frames
+
+# Out-of-core mode for very large runs. Every per-file sheet is written to a spill
+# area on disk as soon as it is read (in the worker process), column by column:
+# numpy-backed columns as .npy files that are read back memory-mapped, every other
+# column pickled. The merged sheets are then built from disk one at a time while
+# the ZIP is written, so memory holds one merged sheet instead of all of them plus
+# every per-file frame.
+
+
+class SpillArea:
+    # A private temporary directory for the spilled frames of one run
+    def __init__(self, directory=None):
+        self.directory = tempfile.mkdtemp(prefix="lobs_spill_", dir=directory)
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+
+def spill_frame(df, directory):
+    # Write df to a new folder in directory and return its path
+    path = tempfile.mkdtemp(dir=directory)
+    kinds = []
+    for i, (_, series) in enumerate(df.items()):
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufcmM":
+            np.save(os.path.join(path, f"{i}.npy"), series.to_numpy())
+            kinds.append("npy")
+        else:
+            with open(os.path.join(path, f"{i}.pkl"), 'wb') as f:
+                pickle.dump(series.reset_index(drop=True), f, protocol=pickle.HIGHEST_PROTOCOL)
+            kinds.append("pkl")
+    with open(os.path.join(path, "frame.pkl"), 'wb') as f:
+        pickle.dump((df.columns, kinds, len(df)), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def load_frame(path):
+    # The frame written by spill_frame; numeric columns stay memory-mapped
+    with open(os.path.join(path, "frame.pkl"), 'rb') as f:
+        columns, kinds, rows = pickle.load(f)
+    data = {}
+    for i, kind in enumerate(kinds):
+        if kind == "npy":
+            data[i] = pd.Series(np.load(os.path.join(path, f"{i}.npy"), mmap_mode="r"), copy=False)
+        else:
+            with open(os.path.join(path, f"{i}.pkl"), 'rb') as f:
+                data[i] = pickle.load(f)
+    df = pd.DataFrame(data, index=pd.RangeIndex(rows), copy=False)
+    df.columns = columns
+    return df
+
+
+class SpilledSheets:
+    # {sheet: merged DataFrame} over spilled per-file frames, for write_sheets_zip:
+    # a sheet is merged from disk when it is popped and its spill files are removed.
+    # finish(sheet, df) is applied to every merged sheet.
+    def __init__(self, parts, finish=None):
+        # parts: {sheet: [spill paths in file order]}
+        self._parts = dict(parts)
+        self._finish = finish
+
+    def __iter__(self):
+        return iter(self._parts)
+
+    def __len__(self):
+        return len(self._parts)
+
+    def __contains__(self, sheet):
+        return sheet in self._parts
+
+    def pop(self, sheet):
+        paths = self._parts.pop(sheet)
+        df = merge_frames([load_frame(path) for path in paths])
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+        return self._finish(sheet, df) if self._finish else df
@@ -0,0 +1,160 @@
+import io
+import mmap
+import os
+import tempfile
+import weakref
+
+from cache import content_hash, private_directory, user_temp_directory
+
+# Uploads spooled to disk. Streamlit hands the script in-memory UploadedFiles, and
+# sending their bytes to the reader processes copied every workbook into each
+# process that read it (and into the background parse pool as well). A spool
+# writes each upload to a file once, hashing it in the same pass, and the readers
+# get a SpooledUpload: a path that is pickled as such and opened by the reader as
+# a MappedFile, so the workbook is read from the page cache instead of from a
+# private copy. A spooled file is removed as soon as the last SpooledUpload
+# referring to it is dropped (the session's spool and the runs using it), and at
+# the latest when the process exits. The uploads are reserve data, so the spool
+# directory is private to the user running the app (see cache.private_directory).
+
+DEFAULT_SPOOL_DIR = os.environ.get("LOBS_SPOOL_DIR", user_temp_directory("lobs_reserves_uploads"))
+
+_CHUNK = 1 << 20
+
+
+class MappedFile(io.RawIOBase):
+    # Read-only, seekable file object over a memory map of a file on disk, for the
+    # readers that want a file object (zipfile, pandas' Excel engines)
+    def __init__(self, path):
+        super().__init__()
+        with open(path, 'rb') as f:
+            self._size = os.fstat(f.fileno()).st_size
+            # An empty file cannot be mapped; it is read as b""
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._size else b""
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = offset
+        return self._pos
+
+    def read(self, size=-1):
+        self._checkClosed()
+        end = self._size if size is None or size < 0 else min(self._size, self._pos + size)
+        data = self._map[self._pos:end] if end > self._pos else b""
+        self._pos += len(data)
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        memoryview(b).cast("B")[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed and self._size:
+            self._map.close()
+        super().close()
+
+
+class SpooledUpload(os.PathLike):
+    # An upload on disk: name is the uploaded file name, digest its content hash
+    # (as cache.file_digest) and size its length. It can be used wherever a path
+    # can; copies pickled to other processes do not own the file.
+    def __init__(self, name, path, digest, size):
+        self.name = name
+        self.path = path
+        self.digest = digest
+        self.size = size
+
+    def __fspath__(self):
+        return self.path
+
+    def __reduce__(self):
+        return SpooledUpload, (self.name, self.path, self.digest, self.size)
+
+    def __repr__(self):
+        return f"SpooledUpload({self.name!r}, {self.path!r})"
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def spool_upload(file, directory=DEFAULT_SPOOL_DIR):
+    # Write an upload (a binary file object, e.g. Streamlit's UploadedFile) to a
+    # new file under directory and return its SpooledUpload. An UploadedFile's
+    # getvalue() is the bytes it was created from, so it is written without a
+    # copy; other files are copied in chunks. Raises PermissionError if directory
+    # is not private to this user.
+    private_directory(directory)
+    name = getattr(file, "name", "upload")
+    fd, path = tempfile.mkstemp(dir=directory, suffix=os.path.splitext(name)[-1])
+    h = content_hash()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            if hasattr(file, "getvalue"):
+                data = file.getvalue()
+                h.update(data)
+                out.write(data)
+                size = len(data)
+            else:
+                file.seek(0)
+                for chunk in iter(lambda: file.read(_CHUNK), b""):
+                    h.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+    except BaseException:
+        _remove(path)
+        raise
+    upload = SpooledUpload(name, path, h.hexdigest(), size)
+    weakref.finalize(upload, _remove, path)
+    return upload
+
+
+class UploadSpool:
+    # The spooled copies of one session's uploads. sync() is called with the
+    # uploads selected on every rerun: each upload is spooled the first time it is
+    # seen, and the ones no longer selected are released (their files go as soon
+    # as no run uses them any more).
+    def __init__(self, directory=DEFAULT_SPOOL_DIR):
+        self.directory = directory
+        self._uploads = {}
+
+    @staticmethod
+    def _upload_id(file):
+        # Streamlit gives every upload a file_id; other files go by identity
+        file_id = getattr(file, "file_id", None)
+        return file if file_id is None else file_id
+
+    def sync(self, files):
+        # The SpooledUploads of files, in the same order
+        uploads = {}
+        for file in files:
+            upload_id = self._upload_id(file)
+            upload = self._uploads.get(upload_id) or uploads.get(upload_id)
+            if upload is None:
+                upload = spool_upload(file, self.directory)
+            uploads[upload_id] = upload
+        self._uploads = uploads
+        return [uploads[self._upload_id(file)] for file in files]
@@ -0,0 +1,81 @@
+import os
+import pickle
+import stat
+
+import pandas as pd
+import pytest
+
+from cache import SheetCache, file_digest
+
+posix_only = pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+
+
+def test_round_trip(tmp_path):
+    cache = SheetCache(str(tmp_path / "cache"))
+    df = pd.DataFrame({"a": [1.0, 2.0], "b": ["x", "y"]})
+    cache.put("d1", "SHEET", df)
+    pd.testing.assert_frame_equal(cache.get("d1", "SHEET"), df)
+    assert cache.get("d1", "SHEET", normalize=False) is None
+    cache.put_sheet_names("d1", ["B", "A"])
+    assert cache.get_sheet_names("d1") == ["A", "B"]
+
+
+def test_file_digest_of_bytes_and_path(tmp_path):
+    path = tmp_path / "book.xlsx"
+    path.write_bytes(b"content")
+    assert file_digest(b"content") == file_digest(str(path))
+
+
+@posix_only
+def test_directory_is_private(tmp_path):
+    cache = SheetCache(str(tmp_path / "cache"))
+    assert stat.S_IMODE(os.stat(cache.directory).st_mode) == 0o700
+
+
+@posix_only
+def test_existing_directory_is_tightened(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir(mode=0o755)
+    os.chmod(directory, 0o755)
+    SheetCache(str(directory))
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+
+@posix_only
+def test_shared_directory_is_refused(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    os.chmod(directory, 0o777)
+    with pytest.raises(PermissionError):
+        SheetCache(str(directory))
+
+
+@posix_only
+def test_symlinked_directory_is_refused(tmp_path):
+    target = tmp_path / "elsewhere"
+    target.mkdir(mode=0o700)
+    os.symlink(target, tmp_path / "cache")
+    with pytest.raises(PermissionError):
+        SheetCache(str(tmp_path / "cache"))
+
+
+class _Unloadable:
+    # Pickles fine, fails on load the way a class removed in another pandas
+    # version does
+    def __reduce__(self):
+        return (_missing_callable, ())
+
+
+def _missing_callable():
+    raise AttributeError("module has no attribute 'Block'")
+
+
+@pytest.mark.parametrize("payload", [b"", b"\x80\x05truncated", pickle.dumps(_Unloadable())])
+def test_bad_entries_are_misses_and_removed(tmp_path, payload):
+    cache = SheetCache(str(tmp_path / "cache"))
+    cache.put("d1", "SHEET", pd.DataFrame({"a": [1]}))
+    (path,) = [entry for _, _, entry in cache.entries()]
+    with open(path, "wb") as f:
+        f.write(payload)
+    assert cache.get("d1", "SHEET") is None
+    assert not os.path.exists(path)
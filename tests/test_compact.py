@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from compact import compact_frame, original_dtypes, restore_frame
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"GOC_ID": [f"GOC_{i % 5}" for i in range(100)],
+                         "UNIQUE": [f"id{i}" for i in range(100)],
+                         "whole": rng.integers(-1000, 1000, 100).astype(float),
+                         "quarters": rng.integers(0, 400, 100) / 4,
+                         "blanks": np.where(np.arange(100) % 3, 1.5, np.nan),
+                         "inexact": rng.random(100),
+                         "small": rng.integers(0, 100, 100),
+                         "wide": rng.integers(0, 100, 100) * 10 ** 6,
+                         "huge": np.arange(100, dtype=np.int64) + 2 ** 40})
+
+
+def test_compacted_dtypes(frame):
+    dtypes = compact_frame(frame).dtypes
+    assert isinstance(dtypes["GOC_ID"], pd.CategoricalDtype)
+    assert dtypes["UNIQUE"] == frame.dtypes["UNIQUE"]
+    assert [dtypes[column] for column in ["whole", "quarters", "blanks"]] == [np.float32] * 3
+    assert dtypes["inexact"] == np.float64
+    assert (dtypes["small"], dtypes["wide"], dtypes["huge"]) == (np.int8, np.int32, np.int64)
+
+
+def test_round_trip(frame):
+    compacted = compact_frame(frame)
+    assert original_dtypes(compacted) == dict(frame.dtypes)
+    pd.testing.assert_frame_equal(restore_frame(compacted), frame)
+
+
+def test_same_csv(frame):
+    compacted = compact_frame(frame)
+    expected = frame.to_csv(index=False)
+    assert restore_frame(compacted, for_csv=True).to_csv(index=False) == expected
+    assert not (restore_frame(compacted, for_csv=True).dtypes == np.float32).any()
+
+
+def test_input_is_not_changed(frame):
+    before = frame.copy()
+    compact_frame(frame)
+    pd.testing.assert_frame_equal(frame, before)
+
+
+def test_empty_frame():
+    df = pd.DataFrame({"a": pd.Series([], dtype=np.int64), "b": pd.Series([], dtype=float)})
+    pd.testing.assert_frame_equal(restore_frame(compact_frame(df)), df)
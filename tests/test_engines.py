@@ -0,0 +1,90 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from compact import compact_frame
+from engines import ArrowEngine, PandasEngine, get_engine
+
+pytest.importorskip("pyarrow")
+
+FLOATS = [0.0, -0.0, 1.0, -1.5, 0.1 + 0.2, 1e-4, 9.99e-5, 1e-5, 123456789.123, 1e15 + 0.5, 9999999999999998.0,
+          1e16, -1e16, 1e17, 2.0 ** 53 + 2, 5e-324, 1.7976931348623157e308, np.inf, -np.inf, np.nan]
+
+
+def csv(engine, df):
+    buffer = io.BytesIO()
+    engine.write_csv(df, buffer)
+    return buffer.getvalue()
+
+
+def assert_parity(df):
+    expected = csv(PandasEngine(), df)
+    # Small chunks and two threads, so that the rows are split and reordered
+    assert csv(ArrowEngine(threads=2, chunk_rows=3), df) == expected
+    assert csv(ArrowEngine(threads=1), df) == expected
+
+
+def test_float_edge_cases():
+    assert_parity(pd.DataFrame({"f": FLOATS, "g": FLOATS[::-1]}))
+
+
+def test_random_floats():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.normal(0, 1e6, 500), rng.integers(-10 ** 6, 10 ** 6, 500) + rng.random(500).round(4),
+                             10.0 ** rng.integers(-8, 20, 500) * rng.random(500)])
+    assert_parity(pd.DataFrame({"a": values, "b": values * -1}))
+
+
+def test_strings_needing_quotes():
+    texts = ["plain", 'say "hi"', "a,b", "line\nbreak", "cr\rhere", "", None, " padded ", "é ü 中", '"', ","]
+    assert_parity(pd.DataFrame({"s": texts, "n": range(len(texts))}))
+
+
+def test_integers_bools_and_categoricals():
+    df = pd.DataFrame({"i": np.array([0, -1, 2 ** 62, -2 ** 63], dtype=np.int64),
+                       "u": np.array([0, 1, 2, 2 ** 64 - 1], dtype=np.uint64),
+                       "b": [True, False, True, False],
+                       "c": pd.Categorical(["x", None, "y,z", "x"])})
+    assert_parity(df)
+
+
+def test_column_names_needing_quotes():
+    assert_parity(pd.DataFrame({"a,b": [1.0], 'q"uote': ["x"], "1": [2]}))
+
+
+def test_empty_frame():
+    assert_parity(pd.DataFrame({"a": pd.Series([], dtype=float), "b": pd.Series([], dtype=object)}))
+
+
+@pytest.mark.parametrize("df", [
+    # csv quotes the empty field of a single-column row
+    pd.DataFrame({"only": [1.0, np.nan, 2.5]}),
+    pd.DataFrame({"only": ["x", None, ""]}),
+    # Duplicate column names
+    pd.DataFrame([[1.0, 2.0]], columns=["a", "a"]),
+    # Columns the arrow engine leaves to pandas
+    pd.DataFrame({"mixed": [1, "a", 2.5], "n": [1, 2, 3]}),
+    pd.DataFrame({"when": pd.to_datetime(["2024-01-01", None]), "n": [1.0, 2.0]}),
+    pd.DataFrame({"f32": np.array([0.1, 1.5], dtype=np.float32), "n": [1, 2]}),
+])
+def test_frames_left_to_pandas(df):
+    assert_parity(df)
+
+
+def test_compacted_frames():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({"GOC_ID": [f"GOC_{i % 7}" for i in range(200)],
+                       "whole": rng.integers(-1000, 1000, 200).astype(float),
+                       "exact": rng.integers(0, 100, 200) / 4,
+                       "inexact": rng.random(200),
+                       "count": rng.integers(0, 100, 200)})
+    compacted = compact_frame(df)
+    assert csv(PandasEngine(), compacted) == csv(PandasEngine(), df)
+    assert csv(ArrowEngine(threads=2, chunk_rows=16), compacted) == csv(PandasEngine(), df)
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError, match="unknown engine"):
+        get_engine("polars")
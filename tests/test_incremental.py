@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from compact import compact_frame
+from incremental import MergeState, upload_keys
+from merge import merge_frames
+
+SHEETS = ["BEL", "RA"]
+
+
+class Upload:
+    # Stands for an uploaded workbook: a name and its content
+    def __init__(self, name, data):
+        self.name, self.data = name, data
+
+    def getvalue(self):
+        return self.data
+
+
+def workbook(seed, rows=None, extra=False):
+    # The {sheet: frame} a workbook yields; extra adds a column to BEL
+    rng = np.random.default_rng(seed)
+    rows = rows or 3 + seed
+    bel = pd.DataFrame({"GOC_ID": [f"GOC_{seed}_{i}" for i in range(rows)],
+                        "PV": rng.integers(0, 100, rows).astype(float),
+                        "count": rng.integers(0, 10, rows)})
+    if extra:
+        bel["SCENARIO"] = "up"
+    ra = pd.DataFrame({"GOC_ID": [f"GOC_{seed}"], "RA": [seed / 4]})
+    return {"BEL": bel, "RA": ra}
+
+
+BOOKS = {name: workbook(seed) for seed, name in enumerate(["a.xlsb", "b.xlsb", "c.xlsb", "d.xlsb"])}
+
+
+def uploads(*names):
+    return [Upload(name, name.encode()) for name in names]
+
+
+def rebuilt(files, books):
+    # What a full run merges: every upload read and merged again
+    return {sheet: merge_frames([books[file.name][sheet] for file in files]) for sheet in SHEETS}
+
+
+def update(state, files, books):
+    # Update the state the way PipelineRun does: read only the uploads it lacks
+    keys = upload_keys(files)
+    known = set(state.keys)
+    state.update(keys, {key: books[file.name] for key, file in zip(keys, files) if key not in known})
+
+
+def assert_matches(state, files, books):
+    for sheet, expected in rebuilt(files, books).items():
+        pd.testing.assert_frame_equal(state.merged[sheet], expected)
+
+
+@pytest.mark.parametrize("steps", [
+    [("a.xlsb", "b.xlsb"), ("a.xlsb", "b.xlsb", "c.xlsb")],
+    [("a.xlsb", "b.xlsb", "c.xlsb"), ("a.xlsb", "c.xlsb")],
+    [("a.xlsb", "b.xlsb", "c.xlsb"), ("b.xlsb",), ()],
+    [("a.xlsb", "b.xlsb", "c.xlsb"), ("c.xlsb", "a.xlsb", "b.xlsb")],
+    [("a.xlsb", "b.xlsb"), ("d.xlsb", "b.xlsb", "a.xlsb", "c.xlsb")],
+    [("a.xlsb", "b.xlsb"), ("a.xlsb", "b.xlsb", "a.xlsb"), ("b.xlsb", "a.xlsb")],
+], ids=["add", "remove", "remove-all", "reorder", "add-and-reorder", "duplicate"])
+def test_update_matches_a_full_merge(steps):
+    state = MergeState(SHEETS)
+    for names in steps:
+        files = uploads(*names)
+        update(state, files, BOOKS)
+        assert_matches(state, files, BOOKS)
+
+
+def test_replaced_upload():
+    state = MergeState(SHEETS)
+    update(state, uploads("a.xlsb", "b.xlsb", "c.xlsb"), BOOKS)
+    # b.xlsb uploaded again with other content: a new key, its rows are read again
+    books = dict(BOOKS, **{"b.xlsb": workbook(7)})
+    files = uploads("a.xlsb", "b.xlsb", "c.xlsb")
+    files[1].data = b"b.xlsb, second version"
+    update(state, files, books)
+    assert_matches(state, files, books)
+    assert len(state.merged["BEL"]) == 3 + 10 + 5
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_schema_change_rebuilds(compact, monkeypatch):
+    import incremental
+
+    rebuilds = []
+    monkeypatch.setattr(incremental, "merge_frames",
+                        lambda frames: rebuilds.append(len(frames)) or merge_frames(frames))
+    books = dict(BOOKS, **{"e.xlsb": workbook(4, extra=True)})
+    state = MergeState(SHEETS)
+    # The first update merges every sheet. After that only BEL is rebuilt: while
+    # e.xlsb's extra column is in the merged frame, and once more when it leaves
+    steps = [(("a.xlsb", "b.xlsb"), [2, 2]),
+             (("a.xlsb", "e.xlsb", "b.xlsb"), [3]),
+             (("a.xlsb", "e.xlsb", "b.xlsb", "c.xlsb"), [4]),
+             (("a.xlsb", "b.xlsb", "c.xlsb"), [3]),
+             (("a.xlsb", "b.xlsb", "c.xlsb", "d.xlsb"), [])]
+    for names, expected in steps:
+        rebuilds.clear()
+        files = uploads(*names)
+        update(state, files, books)
+        assert_matches(state, files, books)
+        assert rebuilds == expected
+        if compact:
+            # The app keeps its merge state compacted between runs
+            state.merged = {sheet: compact_frame(df) for sheet, df in state.merged.items()}
+    assert "SCENARIO" not in state.merged["BEL"]
+
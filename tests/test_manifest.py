@@ -0,0 +1,103 @@
+import json
+import os
+import zipfile
+
+import pandas as pd
+import pytest
+
+from manifest import MANIFEST_MEMBER, apply_delta, full_manifest, load_manifest, manifest_path, write_manifest
+from outputs import write_sheets_zip
+
+PLAN = {"A": "A", "B": "B", "C": "C"}
+
+
+def sheets(version):
+    # Three sheets; B changes between versions and C is dropped in version 2
+    frames = {"A": pd.DataFrame({"x": [1.5, 2.0]}),
+              "B": pd.DataFrame({"goc": ["g1", "g2"], "v": [version, version + 1]})}
+    if version == 1:
+        frames["C"] = pd.DataFrame({"y": ["only in v1"]})
+    return frames
+
+
+def package(path, version, base_manifest=None):
+    plan = {output: source for output, source in PLAN.items() if source in sheets(version)}
+    manifest = write_sheets_zip(str(path), plan, sheets(version), base_manifest=base_manifest)
+    write_manifest(manifest_path(str(path)), full_manifest(manifest))
+    return manifest
+
+
+def members(path):
+    with zipfile.ZipFile(path) as zf:
+        return {name: zf.read(name) for name in zf.namelist()}
+
+
+@pytest.fixture
+def packages(tmp_path):
+    base = tmp_path / "v1.zip"
+    base_manifest = package(base, 1)
+    full = tmp_path / "v2.zip"
+    package(full, 2)
+    delta = tmp_path / "v2_delta.zip"
+    delta_manifest = package(delta, 2, base_manifest=base_manifest)
+    return base, full, delta, delta_manifest
+
+
+def test_delta_holds_only_the_changes(packages):
+    _, _, delta, manifest = packages
+    assert manifest["delta"] == {"sheets": ["B"], "removed": ["C"]}
+    assert sorted(members(delta)) == ["B.csv", MANIFEST_MEMBER]
+    assert load_manifest(str(delta))["delta"]["sheets"] == ["B"]
+
+
+def test_round_trip(packages, tmp_path):
+    base, full, delta, _ = packages
+    out = tmp_path / "rebuilt.zip"
+    manifest = apply_delta(str(base), str(delta), str(out))
+    assert out.read_bytes() == full.read_bytes()
+    assert manifest == load_manifest(manifest_path(str(full)))
+    assert json.loads(open(manifest_path(str(out))).read()) == manifest
+
+
+def test_applied_in_place(packages):
+    base, full, delta, _ = packages
+    apply_delta(str(base), str(delta), str(base))
+    assert base.read_bytes() == full.read_bytes()
+    assert [name for name in os.listdir(base.parent) if name.endswith(".tmp")] == []
+
+
+def test_mismatched_base_is_refused(packages, tmp_path):
+    base, _, delta, _ = packages
+    other = tmp_path / "other.zip"
+    with zipfile.ZipFile(base) as zf, zipfile.ZipFile(other, "w") as out:
+        for name in zf.namelist():
+            out.writestr(name, zf.read(name) + (b"tampered\n" if name == "A.csv" else b""))
+    with pytest.raises(ValueError, match="does not match"):
+        apply_delta(str(other), str(delta), str(tmp_path / "rebuilt.zip"))
+    assert not (tmp_path / "rebuilt.zip").exists()
+
+
+def test_failure_in_place_keeps_the_base(packages, tmp_path):
+    base, _, delta, _ = packages
+    tampered = tmp_path / "tampered.zip"
+    with zipfile.ZipFile(base) as zf, zipfile.ZipFile(tampered, "w") as out:
+        for name in zf.namelist():
+            out.writestr(name, b"tampered" if name == "A.csv" else zf.read(name))
+    before = tampered.read_bytes()
+    with pytest.raises(ValueError):
+        apply_delta(str(tampered), str(delta), str(tampered))
+    assert tampered.read_bytes() == before
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+
+def test_full_package_is_not_a_delta(packages, tmp_path):
+    base, full, _, _ = packages
+    with pytest.raises(ValueError, match="not a delta package"):
+        apply_delta(str(base), str(full), str(tmp_path / "out.zip"))
+
+
+def test_load_manifest_rejects_other_json(tmp_path):
+    path = tmp_path / "other.json"
+    path.write_text('{"rows": 1}')
+    with pytest.raises(ValueError):
+        load_manifest(str(path))
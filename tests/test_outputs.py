@@ -0,0 +1,54 @@
+import time
+import zipfile
+
+import pandas as pd
+import pytest
+
+from manifest import MANIFEST_MEMBER, new_manifest
+from outputs import write_sheets_zip
+from parallel_zip import ZIP_DATE_TIME
+
+PLAN = {"A": "A", "B": "B", "B_COPY": "B"}
+
+
+def sheets():
+    return {"A": pd.DataFrame({"x": [1.5, 2.0, float("nan")], "y": ["a", "b,c", None]}),
+            "B": pd.DataFrame({"n": [1, 2, 3], "s": ["p", "q", "r"]})}
+
+
+def build(path, output_format="csv", base_manifest=None):
+    write_sheets_zip(str(path), PLAN, sheets(), output_format, base_manifest=base_manifest)
+    return path.read_bytes()
+
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet"])
+def test_same_sheets_give_the_same_zip_bytes(tmp_path, monkeypatch, output_format):
+    first = build(tmp_path / "first.zip", output_format)
+    # A later clock must not change the package
+    later = time.time() + 3 * 24 * 3600
+    monkeypatch.setattr(time, "time", lambda: later)
+    second = build(tmp_path / "second.zip", output_format)
+    assert first == second
+    with zipfile.ZipFile(tmp_path / "second.zip") as zf:
+        assert {info.date_time for info in zf.infolist()} == {ZIP_DATE_TIME}
+
+
+def test_delta_package_is_reproducible(tmp_path, monkeypatch):
+    base = new_manifest("csv")
+    first = build(tmp_path / "first.zip", base_manifest=base)
+    later = time.time() + 3 * 24 * 3600
+    monkeypatch.setattr(time, "time", lambda: later)
+    second = build(tmp_path / "second.zip", base_manifest=base)
+    assert first == second
+    with zipfile.ZipFile(tmp_path / "second.zip") as zf:
+        assert zf.getinfo(MANIFEST_MEMBER).date_time == ZIP_DATE_TIME
+
+
+def test_sheet_files_next_to_the_zip(tmp_path):
+    folder = tmp_path / "Dodo_results"
+    folder.mkdir()
+    write_sheets_zip(str(folder / "processed_sheets.zip"), PLAN, sheets(), sheet_dir=str(folder))
+    with zipfile.ZipFile(folder / "processed_sheets.zip") as zf:
+        assert zf.namelist() == ["A.csv", "B.csv", "B_COPY.csv"]
+        for name in zf.namelist():
+            assert (folder / name).read_bytes() == zf.read(name)
@@ -0,0 +1,124 @@
+import io
+import shutil
+import subprocess
+import zipfile
+
+import pytest
+
+import parallel_zip
+from parallel_zip import ZIP_DATE_TIME, ZipWriter, compress_member, write_members
+
+MEMBERS = {"a.csv": b"x,y\n1,2\n" * 1000, "b.csv": b"", "café.csv": b"\xc3\xa9\n" * 50}
+
+
+def zipfile_bytes(members, compression, compresslevel=None):
+    # The archive zipfile writes for members with the same metadata
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", compression, compresslevel=compresslevel) as zf:
+        for name, data in members.items():
+            zinfo = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+            zinfo.compress_type = compression
+            zinfo.create_system = 3
+            zinfo.external_attr = 0o600 << 16
+            zf.writestr(zinfo, data, compresslevel=compresslevel)
+    return out.getvalue()
+
+
+def writer_bytes(members, compression, compresslevel=None, workers=2):
+    out = io.BytesIO()
+    with ZipWriter(out, compression, compresslevel=compresslevel) as zipw:
+        write_members(zipw, [(name, name, lambda data=data: io.BytesIO(data)) for name, data in members.items()],
+                      workers=workers)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("compression, compresslevel", [(zipfile.ZIP_DEFLATED, None), (zipfile.ZIP_DEFLATED, 1),
+                                                        (zipfile.ZIP_STORED, None)])
+def test_same_bytes_as_zipfile(compression, compresslevel):
+    assert writer_bytes(MEMBERS, compression, compresslevel) == zipfile_bytes(MEMBERS, compression, compresslevel)
+
+
+def test_aliases_share_compressed_data():
+    out = io.BytesIO()
+    produced = []
+
+    def produce(data):
+        produced.append(data)
+        return io.BytesIO(data)
+
+    with ZipWriter(out) as zipw:
+        write_members(zipw, [("a.csv", "A", lambda: produce(b"1\n")), ("b.csv", "B", lambda: produce(b"2\n")),
+                             ("a2.csv", "A", lambda: produce(b"1\n"))])
+    assert produced == [b"1\n", b"2\n"]
+    with zipfile.ZipFile(out) as zf:
+        assert zf.namelist() == ["a.csv", "b.csv", "a2.csv"]
+        assert zf.read("a2.csv") == b"1\n"
+
+
+def test_writestr_and_keep(tmp_path):
+    path = tmp_path / "out.zip"
+    with ZipWriter(str(path)) as zipw:
+        write_members(zipw, [(name, name, lambda data=data: io.BytesIO(data)) for name, data in MEMBERS.items()],
+                      keep=lambda name, member: name != "b.csv")
+        zipw.writestr("manifest.json", b"{}")
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["a.csv", "café.csv", "manifest.json"]
+
+
+def test_duplicate_names_are_refused():
+    with ZipWriter(io.BytesIO()) as zipw:
+        zipw.writestr("a.csv", b"1")
+        with pytest.raises(ValueError):
+            zipw.writestr("a.csv", b"2")
+
+
+def test_failed_write_leaves_no_directory():
+    out = io.BytesIO()
+    with pytest.raises(RuntimeError):
+        with ZipWriter(out) as zipw:
+            zipw.writestr("a.csv", b"1")
+            raise RuntimeError("serializer failed")
+    with pytest.raises(zipfile.BadZipFile):
+        zipfile.ZipFile(out)
+
+
+def test_zip64_records(tmp_path, monkeypatch):
+    # Lower limits stand for members, offsets and counts past the classic fields
+    monkeypatch.setattr(parallel_zip, "ZIP64_LIMIT", 100)
+    monkeypatch.setattr(parallel_zip, "ZIP_FILECOUNT_LIMIT", 2)
+    members = {f"m{i}.csv": bytes(range(256)) * (i + 1) for i in range(4)}
+    path = tmp_path / "zip64.zip"
+    with ZipWriter(str(path), zipfile.ZIP_STORED) as zipw:
+        for name, data in members.items():
+            zipw.writestr(name, data)
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        assert {name: zf.read(name) for name in zf.namelist()} == members
+        assert all(info.extract_version == 45 for info in zf.infolist())
+    if shutil.which("unzip"):
+        subprocess.run(["unzip", "-tq", str(path)], check=True, capture_output=True)
+
+
+def test_compress_member_of_a_path(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(MEMBERS["a.csv"])
+    member = compress_member(str(path))
+    try:
+        assert member.file_size == len(MEMBERS["a.csv"])
+        assert member.compress_size < member.file_size
+    finally:
+        member.close()
+
+
+def test_small_members_have_no_zip64_fields():
+    # Only members, offsets and counts past 2 GiB get ZIP64 fields; small CSVs
+    # stay readable by unzip tools without ZIP64 support
+    data = writer_bytes(MEMBERS, zipfile.ZIP_DEFLATED)
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        for info in zf.infolist():
+            assert info.extra == b""
+            assert info.extract_version == 20
+            local = parallel_zip._LOCAL_HEADER.unpack_from(data, info.header_offset)
+            assert local[1] == 20 and local[-1] == 0
+    assert b"PK\x06\x06" not in data and b"PK\x06\x07" not in data
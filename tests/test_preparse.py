@@ -0,0 +1,100 @@
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from bench import header_block, write_xlsb
+from extraction import extract_all
+from preparse import collect_results, job_status, lost_to_broken_pool, release_jobs, start_preparse, take_jobs
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    paths = []
+    for i in range(4):
+        path = str(tmp_path / f"book{i}.xlsb")
+        write_xlsb(path, {"S": header_block("S") + [["GOC_ID", "VALUE"], [f"goc{i}", i]]})
+        paths.append(path)
+    return paths
+
+
+def done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def test_deselected_files_are_dropped(workbooks):
+    with ThreadPoolExecutor(2) as pool:
+        jobs = start_preparse(pool, {}, ["a", "b"], workbooks[:2], ["S"])
+        start_preparse(pool, jobs, ["b"], workbooks[1:2], ["S"])
+        assert list(jobs) == ["b"]
+        release_jobs(jobs)
+        assert jobs == {}
+
+
+def test_taken_jobs_leave_the_session(workbooks):
+    with ThreadPoolExecutor(2) as pool:
+        jobs = start_preparse(pool, {}, ["a", "b"], workbooks[:2], ["S"])
+        taken = take_jobs(jobs, ["a", "b"])
+        assert jobs == {"a": None, "b": None}
+        assert job_status(jobs["a"]) == "used"
+        results = collect_results(taken, ["a", "b"])
+    assert taken == {}
+    assert [results[key].frames["S"]["GOC_ID"].tolist() for key in "ab"] == [["goc0"], ["goc1"]]
+
+
+def test_failed_jobs_are_read_again():
+    failed = Future()
+    failed.set_exception(RuntimeError("worker died"))
+    cancelled = Future()
+    cancelled.cancel()
+    results = collect_results({"a": failed, "b": cancelled, "c": done("result")}, ["a", "b", "c"])
+    assert results == {"c": "result"}
+
+
+def test_extract_all_on_a_shared_executor_keeps_file_order(workbooks):
+    active, peak, lock = [0], [0], threading.Lock()
+
+    class CountingPool(ThreadPoolExecutor):
+        # Records how many reads run at once
+        def submit(self, fn, *args):
+            def counted():
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                try:
+                    return fn(*args)
+                finally:
+                    with lock:
+                        active[0] -= 1
+            return super().submit(counted)
+
+    with CountingPool(4) as pool:
+        results = extract_all(workbooks, ["S"], workers=2, executor=pool)
+    assert [result.frames["S"]["GOC_ID"].tolist() for result in results] == [[f"goc{i}"] for i in range(4)]
+    assert peak[0] <= 2
+
+
+def test_broken_pool_is_reported_and_its_jobs_submitted_again(workbooks):
+    with ProcessPoolExecutor(1) as broken:
+        # A worker that dies, as when it is killed for running out of memory
+        lost = broken.submit(os._exit, 1)
+        assert isinstance(lost.exception(), BrokenProcessPool)
+        jobs = {"a": lost}
+        assert job_status(lost) == "failed" and lost_to_broken_pool(lost)
+        with pytest.raises(BrokenProcessPool):
+            start_preparse(broken, jobs, ["a", "b"], workbooks[:2], ["S"])
+    assert collect_results({"a": lost}, ["a"]) == {}
+    with ThreadPoolExecutor(2) as pool:
+        start_preparse(pool, jobs, ["a", "b"], workbooks[:2], ["S"])
+        assert jobs["a"] is not lost
+        assert [jobs[key].result().frames["S"]["GOC_ID"].tolist() for key in "ab"] == [["goc0"], ["goc1"]]
+
+
+def test_extract_all_on_its_own_pool(workbooks):
+    # The run's own pool starts its workers with START_METHOD ("spawn")
+    results = extract_all(workbooks, ["S"], workers=2)
+    assert [result.frames["S"]["GOC_ID"].tolist() for result in results] == [[f"goc{i}"] for i in range(4)]
@@ -0,0 +1,101 @@
+import pytest
+
+from publish import PublishJob, git_blob_sha, publish_file
+
+
+class UnknownObjectException(Exception):
+    # Stands for github.UnknownObjectException, which carries status 404
+    status = 404
+
+
+class FakeContents:
+    def __init__(self, data):
+        self.sha = git_blob_sha(data)
+
+
+class FakeRepo:
+    # The get_contents/create_file/update_file part of github.Repository over a
+    # dict of files; get_error is raised by get_contents when set
+    def __init__(self, files=None, get_error=None):
+        self.files = dict(files or {})
+        self.get_error = get_error
+        self.calls = []
+
+    def get_contents(self, path, ref):
+        if self.get_error is not None:
+            raise self.get_error
+        if path not in self.files:
+            raise UnknownObjectException(path)
+        return FakeContents(self.files[path])
+
+    def create_file(self, path, message, content, branch):
+        self.calls.append(("create", path, branch))
+        self.files[path] = content
+
+    def update_file(self, path, message, content, sha, branch):
+        assert sha == git_blob_sha(self.files[path])
+        self.calls.append(("update", path, branch))
+        self.files[path] = content
+
+
+def test_git_blob_sha_matches_git():
+    # git hash-object of a file holding "hello\n"
+    assert git_blob_sha(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_creates_missing_file():
+    repo = FakeRepo()
+    assert publish_file(repo, "Dodo_results/a.zip", b"data") == "created"
+    assert repo.calls == [("create", "Dodo_results/a.zip", "main")]
+    assert repo.files["Dodo_results/a.zip"] == b"data"
+
+
+def test_updates_changed_file():
+    repo = FakeRepo({"a.zip": b"old"})
+    assert publish_file(repo, "a.zip", b"new", branch="dev") == "updated"
+    assert repo.calls == [("update", "a.zip", "dev")]
+    assert repo.files["a.zip"] == b"new"
+
+
+def test_skips_unchanged_file():
+    repo = FakeRepo({"a.zip": b"same"})
+    assert publish_file(repo, "a.zip", b"same") == "unchanged"
+    assert repo.calls == []
+
+
+def test_status_404_means_missing():
+    error = Exception("Not Found")
+    error.status = 404
+    repo = FakeRepo(get_error=error)
+    assert publish_file(repo, "a.zip", b"data") == "created"
+
+
+@pytest.mark.parametrize("error", [ConnectionError("reset"), TimeoutError("timed out"), AttributeError("oops")])
+def test_other_errors_are_raised(error):
+    repo = FakeRepo(get_error=error)
+    with pytest.raises(type(error)):
+        publish_file(repo, "a.zip", b"data")
+    assert repo.calls == []
+
+
+def test_api_errors_other_than_404_are_raised():
+    error = Exception("Forbidden")
+    error.status = 403
+    repo = FakeRepo(get_error=error)
+    with pytest.raises(Exception, match="Forbidden"):
+        publish_file(repo, "a.zip", b"data")
+    assert repo.calls == []
+
+
+def test_publish_job_connects_on_its_thread():
+    repo = FakeRepo()
+    job = PublishJob(lambda: repo, "a.zip", b"data").start()
+    assert job.wait(10)
+    assert job.status == "created"
+
+
+def test_publish_job_reports_failures():
+    job = PublishJob(FakeRepo(get_error=ConnectionError("reset")), "a.zip", b"data").start()
+    assert job.wait(10)
+    assert job.status == "failed"
+    assert isinstance(job.error, ConnectionError)
@@ -0,0 +1,95 @@
+import os
+import threading
+
+from scheduler import JobScheduler
+
+
+def blocked():
+    # A job function that runs until release is set
+    release = threading.Event()
+
+    def fn(job, value):
+        job.set_progress(0.5, "halfway")
+        job.report("info", f"computing {value}")
+        release.wait(5)
+        return value
+    return fn, release
+
+
+def test_same_key_shares_one_job():
+    scheduler = JobScheduler(workers=1)
+    fn, release = blocked()
+    job, created = scheduler.submit("k", fn, 1)
+    again, created_again = scheduler.submit("k", fn, 2)
+    assert (created, created_again) == (True, False) and again is job
+    release.set()
+    assert job.wait(5)
+    assert (job.status, job.result) == ("done", 1)
+    assert job.progress == (0.5, "halfway")
+    assert job.messages == [("info", "computing 1")]
+    assert scheduler.submit("k", fn, 3) == (job, False)
+
+
+def test_failed_job_is_retried():
+    scheduler = JobScheduler()
+
+    def fail(job):
+        raise RuntimeError("parse failed")
+    job, _ = scheduler.submit("k", fail)
+    assert job.wait(5) and job.status == "failed"
+    assert isinstance(job.error, RuntimeError)
+    retry, created = scheduler.submit("k", lambda job: "ok")
+    assert created and retry is not job
+    assert retry.wait(5) and retry.result == "ok"
+
+
+def test_queue_position():
+    scheduler = JobScheduler(workers=1)
+    fn, release = blocked()
+    first, _ = scheduler.submit("a", fn, 1)
+    second, _ = scheduler.submit("b", fn, 2)
+    third, _ = scheduler.submit("c", fn, 3)
+    while first.status == "queued":
+        first.wait(0.01)
+    assert (scheduler.position(first), scheduler.position(second), scheduler.position(third)) == (None, 1, 2)
+    assert scheduler.queued() == 2
+    release.set()
+    assert third.wait(5) and scheduler.queued() == 0
+
+
+def test_expired_jobs_remove_their_files(tmp_path):
+    scheduler = JobScheduler(ttl=0)
+    path = tmp_path / "package.zip"
+
+    def produce(job):
+        path.write_bytes(b"zip")
+        job.temp_paths.append(str(path))
+        return str(path)
+    job, _ = scheduler.submit("k", produce)
+    assert job.wait(5) and path.exists()
+    job.finished -= 1
+    assert scheduler.expired(job)
+    assert not os.path.exists(path) and job.result is None
+    assert scheduler.submit("k", produce)[1]
+
+
+def test_incomplete_job_is_run_again(tmp_path):
+    scheduler = JobScheduler()
+    path = tmp_path / "package.zip"
+    path.write_bytes(b"zip")
+
+    def incomplete(job):
+        job.report("error", "Error reading MP_GOC from a.xlsb: out of memory")
+        job.shareable = False
+        job.temp_paths.append(str(path))
+        return "partial"
+    job, _ = scheduler.submit("k", incomplete)
+    assert job.wait(5) and job.status == "done"
+    retry, created = scheduler.submit("k", lambda job: "complete")
+    assert created and retry is not job
+    assert retry.wait(5) and retry.result == "complete"
+    # The replaced result is kept for the sessions showing it until it expires
+    assert not scheduler.expired(job) and path.exists()
+    scheduler.ttl = 0
+    job.finished -= 1
+    assert scheduler.expired(job) and not path.exists()
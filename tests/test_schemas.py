@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from schemas import NUMBER, SCHEMAS, TEXT, SheetSchema, schema_for
+
+
+def test_columns_are_cast_to_their_declared_types():
+    schema = SheetSchema(text=["GOC_ID"], number=["COUNT"])
+    df = pd.DataFrame({"GOC_ID": [1, None, 3.5], "COUNT": ["2", None, "x"], "PV": [1.5, np.nan, 2.0],
+                       "N": np.array([1, 2, 3], dtype=np.int64)})
+    df = schema.apply(df)
+    assert df["GOC_ID"].tolist()[::2] == ["1.0", "3.5"] and pd.isna(df["GOC_ID"][1])
+    assert df["COUNT"].tolist() == [2.0, 0.0, 0.0]
+    assert df["PV"].tolist() == [1.5, 0.0, 2.0]
+    assert df["N"].dtype == np.int64
+
+
+def test_text_default():
+    schema = SheetSchema(number=["ANNUAL_COHORT"], default=TEXT)
+    assert schema.column_type("ANNUAL_COHORT") == NUMBER
+    assert schema.column_type("ANYTHING") == TEXT
+    df = schema.apply(pd.DataFrame({"ANNUAL_COHORT": ["2024", ""], "NAME": [1.0, np.nan]}))
+    assert df["ANNUAL_COHORT"].tolist() == [2024, 0]
+    assert df["NAME"].tolist()[0] == "1.0" and pd.isna(df["NAME"][1])
+
+
+def test_text_columns_already_strings_are_kept():
+    schema = SheetSchema(text=["GOC_ID"])
+    df = pd.DataFrame({"GOC_ID": ["007", None]})
+    pd.testing.assert_series_equal(schema.apply(df.copy())["GOC_ID"], df["GOC_ID"])
+
+
+def test_dropped_columns():
+    schema = SCHEMAS["ACTUARIAL_AOM_IMPACT"]
+    df = pd.DataFrame({"GOC_ID": ["g"], "STEP_ID": ["s"], "* MACRO_STEP_ID_DESCRIPTION": ["d"], "V": [1.0]})
+    assert list(schema.apply(df).columns) == ["GOC_ID", "STEP_ID", "V"]
+    options = schema.read_options()
+    assert [column for column in df.columns if options["usecols"](column)] == ["GOC_ID", "STEP_ID", "V"]
+    assert options["dtype"] == {"GOC_ID": str, "STEP_ID": str}
+
+
+def test_schema_for():
+    assert schema_for("MP_GOC") is SCHEMAS["MP_GOC"]
+    assert schema_for("CF_T1_PVFC_LIC_OP_FADJ_PY") is schema_for("CF_T1_PVFC_LIC_CLO")
+    assert schema_for("CF_T1_PVFC_LIC_CLO").column_type("VARIABLE_NAME") == TEXT
+    assert schema_for("UNKNOWN_SHEET") is None
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench import synthetic_rows, write_xlsb
+from pipeline import PipelineRun, run
+from spill import load_frame, spill_frame
+
+
+@pytest.fixture(scope="module")
+def workbooks(tmp_path_factory):
+    # Three workbooks with a few sheets of the plan, one without the cash-flow sheet
+    folder = tmp_path_factory.mktemp("books")
+    paths = []
+    for seed in range(3):
+        sheets = ["MP_GOC", "MP_GOC_SEG", "ACTUALS_FOR_VISUALIZATION"] + ["CF_T1_PVFC_LIC_CLO"] * (seed != 1)
+        path = str(folder / f"book{seed}.xlsb")
+        write_xlsb(path, {sheet: synthetic_rows(sheet, seed, rows_scale=0.05) for sheet in sheets})
+        paths.append(path)
+    return paths
+
+
+def test_spilled_frame_round_trip(tmp_path):
+    df = pd.DataFrame({"GOC_ID": ["a", None, "c"], "PV": [1.5, np.nan, -2.0], "count": [1, 2, 3],
+                       "flag": [True, False, True], "mixed": ["x", 1, 2.5]})
+    df.columns = ["GOC_ID", "PV", "count", "flag", 1]
+    # Numeric columns come back memory-mapped
+    pd.testing.assert_frame_equal(load_frame(spill_frame(df, str(tmp_path))).copy(), df)
+
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet"])
+def test_spilled_run_writes_the_same_package(tmp_path, workbooks, output_format):
+    run(workbooks, str(tmp_path / "memory.zip"), output_format, workers=1)
+    run(workbooks, str(tmp_path / "spilled.zip"), output_format, workers=1, spill=True, spill_dir=str(tmp_path))
+    assert (tmp_path / "spilled.zip").read_bytes() == (tmp_path / "memory.zip").read_bytes()
+    assert [name for name in os.listdir(tmp_path) if name.startswith("lobs_spill_")] == []
+
+
+def test_spill_files_are_removed(tmp_path, workbooks):
+    pipeline = PipelineRun(workbooks, spill=True, spill_dir=str(tmp_path))
+    pipeline.read(workers=1)
+    pipeline.merge()
+    area = pipeline.spill.directory
+    # One folder per sheet of every workbook
+    assert len(os.listdir(area)) == sum(len(paths) for paths in pipeline.spilled.values()) > 0
+    sheets = pipeline.take_processed_sheets()
+    sheet = next(iter(sheets))
+    sheets.pop(sheet)
+    # A written sheet's files go right away, the rest once the run is closed
+    assert not any(os.path.exists(path) for path in pipeline.spilled[sheet])
+    assert os.listdir(area)
+    pipeline.close()
+    assert not os.path.exists(area)
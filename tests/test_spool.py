@@ -0,0 +1,97 @@
+import gc
+import io
+import os
+import pickle
+import stat
+import zipfile
+
+import pytest
+
+from cache import file_digest
+from spool import MappedFile, UploadSpool, spool_upload
+
+posix_only = pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+
+
+class Upload(io.BytesIO):
+    # Stands for Streamlit's UploadedFile
+    def __init__(self, name, data, file_id):
+        super().__init__(data)
+        self.name = name
+        self.file_id = file_id
+
+
+def test_mapped_file_reads_like_a_file(tmp_path):
+    path = tmp_path / "data.bin"
+    data = bytes(range(256)) * 40
+    path.write_bytes(data)
+    with MappedFile(str(path)) as f:
+        assert f.read(10) == data[:10] and f.tell() == 10
+        assert f.seek(-5, io.SEEK_END) == len(data) - 5 and f.read() == data[-5:]
+        assert f.read(1) == b""
+        f.seek(100)
+        f.seek(20, io.SEEK_CUR)
+        buffer = bytearray(8)
+        assert f.readinto(buffer) == 8 and bytes(buffer) == data[120:128]
+        f.seek(0)
+        assert io.BufferedReader(f).read() == data
+        with pytest.raises(ValueError):
+            f.seek(-1)
+    with pytest.raises(ValueError):
+        f.read()
+
+
+def test_mapped_file_of_a_zip_and_an_empty_file(tmp_path):
+    path = tmp_path / "book.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("a.txt", b"hello")
+    with MappedFile(str(path)) as f, zipfile.ZipFile(f) as zf:
+        assert zf.read("a.txt") == b"hello"
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    with MappedFile(str(empty)) as f:
+        assert f.read() == b""
+
+
+def test_spooled_upload(tmp_path):
+    upload = spool_upload(Upload("book.xlsb", b"workbook", "id1"), str(tmp_path / "spool"))
+    assert (upload.name, upload.size, upload.digest) == ("book.xlsb", 8, file_digest(b"workbook"))
+    assert os.fspath(upload).endswith(".xlsb") and open(upload, "rb").read() == b"workbook"
+    # A copy sent to a reader process does not own the file
+    copy = pickle.loads(pickle.dumps(upload))
+    del copy
+    gc.collect()
+    assert os.path.exists(upload.path)
+
+
+def test_released_uploads_are_removed(tmp_path):
+    spool = UploadSpool(str(tmp_path / "spool"))
+    a, b = Upload("a.xlsb", b"A", "id-a"), Upload("b.xlsb", b"B", "id-b")
+    first = spool.sync([a, b])
+    assert spool.sync([a, b]) == first
+    path_a, path_b = first[0].path, first[1].path
+    # A run still reading a keeps its file after the session deselects it
+    running = first[0]
+    del first
+    spool.sync([b])
+    gc.collect()
+    assert os.path.exists(path_a)
+    del running
+    gc.collect()
+    assert not os.path.exists(path_a) and os.path.exists(path_b)
+    spool.sync([])
+    gc.collect()
+    assert os.listdir(tmp_path / "spool") == []
+
+
+@posix_only
+def test_spool_directory_is_private(tmp_path):
+    directory = tmp_path / "spool"
+    spool_upload(Upload("a.xlsb", b"A", "id"), str(directory))
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    with pytest.raises(PermissionError):
+        spool_upload(Upload("a.xlsb", b"A", "id"), str(shared))
+    assert os.listdir(shared) == []
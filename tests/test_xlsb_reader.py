@@ -0,0 +1,114 @@
+import pandas as pd
+import pytest
+
+from bench import header_block, write_xlsb
+from workbook_index import WorkbookIndex
+from workbooks import WorkbookSession
+from xlsb_reader import read_xlsb_sheet
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = str(tmp_path / "book.xlsb")
+    write_xlsb(path, {f"S{i}": header_block(f"S{i}") + [["GOC_ID", "VALUE"], [f"goc{i}", 1], ["shared", 2.5]]
+                      for i in range(4)})
+    return path
+
+
+def test_shared_strings_are_decoded_once(workbook):
+    with WorkbookIndex(workbook) as index:
+        opened = []
+        open_part = index._zf.open
+        index._zf.open = lambda name, *args, **kwargs: opened.append(name) or open_part(name, *args, **kwargs)
+        frames = [read_xlsb_sheet(index, sheet) for sheet in index.sheet_names]
+    assert opened.count(index.shared_strings_part) == 1
+    assert [df["GOC_ID"].tolist() for df in frames] == [[f"goc{i}", "shared"] for i in range(4)]
+
+
+def test_session_reads_every_sheet(workbook):
+    with WorkbookSession(workbook) as session:
+        df = session.read("S2")
+    pd.testing.assert_frame_equal(df, pd.DataFrame({"GOC_ID": ["goc2", "shared"], "VALUE": [1.0, 2.5]}))
+
+
+def pyxlsb_frame(path, sheet, **options):
+    return pd.read_excel(path, sheet_name=sheet, skiprows=8, engine="pyxlsb", **options)
+
+
+PARITY_SHEETS = {
+    # Whole and fractional numbers, RK and double cells, values past 2**53
+    "NUMBERS": header_block("NUMBERS") + [["GOC_ID", "WHOLE", "FRACTION", "BIG", "NEGATIVE"]]
+    + [[f"g{i}", i, i + 0.25, 2 ** 53 + 2 * i, -i * 1000003] for i in range(20)],
+    # Blanks in the middle of numeric and text columns, and a column with no values
+    "BLANKS": header_block("BLANKS") + [["GOC_ID", "VALUE", "NOTE", "EMPTY"]]
+    + [[f"g{i}", None if i % 3 == 0 else i * 1.5, None if i % 2 else "note", None] for i in range(12)],
+    # Text and numbers in one column, booleans, and a header with a gap
+    "MIXED": header_block("MIXED") + [["GOC_ID", "MIXED", "FLAG", None, "LAST"]]
+    + [[f"g{i}", "text" if i % 4 == 0 else i, i % 2 == 0, i, f"v{i}"] for i in range(10)],
+    # Numbers in a column the schema reads as text
+    "TEXT_IDS": header_block("TEXT_IDS") + [["GOC_ID", "VARIABLE_NAME", "1"]]
+    + [[i, f"var{i}" if i % 5 else None, i / 8] for i in range(10)],
+}
+
+
+@pytest.fixture
+def parity_workbook(tmp_path):
+    path = str(tmp_path / "parity.xlsb")
+    write_xlsb(path, PARITY_SHEETS)
+    return path
+
+
+@pytest.mark.parametrize("sheet", list(PARITY_SHEETS))
+def test_same_frame_as_pyxlsb(parity_workbook, sheet):
+    with WorkbookIndex(parity_workbook) as index:
+        df = read_xlsb_sheet(index, sheet)
+    pd.testing.assert_frame_equal(df, pyxlsb_frame(parity_workbook, sheet))
+
+
+@pytest.mark.parametrize("sheet", list(PARITY_SHEETS))
+def test_same_frame_as_pyxlsb_with_schema_options(parity_workbook, sheet):
+    options = {"usecols": lambda column: column != "LAST", "dtype": {"GOC_ID": str, "VARIABLE_NAME": str}}
+    with WorkbookIndex(parity_workbook) as index:
+        df = read_xlsb_sheet(index, sheet, **options)
+    pd.testing.assert_frame_equal(df, pyxlsb_frame(parity_workbook, sheet, **options))
+
+
+def test_synthetic_sheets_match_pyxlsb(tmp_path):
+    from bench import synthetic_rows
+
+    sheets = {sheet: synthetic_rows(sheet, seed=3, rows_scale=0.05)
+              for sheet in ["MP_GOC", "INITIALIZATION", "CF_T1_PVFC_LIC_OP"]}
+    path = str(tmp_path / "synthetic.xlsb")
+    write_xlsb(path, sheets)
+    with WorkbookSession(path) as session:
+        for sheet in sheets:
+            pd.testing.assert_frame_equal(session.read(sheet), pyxlsb_frame(path, sheet))
+
+
+@pytest.mark.parametrize("header", [
+    # The projection periods of the cash-flow sheets
+    ["GOC_ID", "VARIABLE_NAME", "PV"] + list(range(12)),
+    ["GOC_ID", 2024, 1.5, -3, 2 ** 40, True, "LAST"],
+])
+def test_numeric_header_cells(tmp_path, header):
+    path = str(tmp_path / "numeric_header.xlsb")
+    rows = [[f"g{i}", f"v{i}"] + [i * 1.25 + j for j in range(len(header) - 2)] for i in range(6)]
+    write_xlsb(path, {"S": header_block("S") + [header] + rows})
+    with WorkbookIndex(path) as index:
+        df = read_xlsb_sheet(index, "S")
+    expected = pyxlsb_frame(path, "S")
+    pd.testing.assert_frame_equal(df, expected)
+    options = {"usecols": lambda column: str(column) != "1", "dtype": {"GOC_ID": str}}
+    with WorkbookIndex(path) as index:
+        pd.testing.assert_frame_equal(read_xlsb_sheet(index, "S", **options), pyxlsb_frame(path, "S", **options))
+
+
+def test_duplicate_header_is_left_to_pandas(tmp_path):
+    from xlsb_reader import UnsupportedLayout
+
+    path = str(tmp_path / "duplicate_header.xlsb")
+    write_xlsb(path, {"S": header_block("S") + [["GOC_ID", 1, "1", "PV", "PV"], ["g1", 1, 2, 3, 4]]})
+    with WorkbookIndex(path) as index, pytest.raises(UnsupportedLayout):
+        read_xlsb_sheet(index, "S")
+    with WorkbookSession(path) as session:
+        pd.testing.assert_frame_equal(session.read("S"), pyxlsb_frame(path, "S"))
@@ -1,22 +1,327 @@
 import streamlit as st
-import pandas as pd
+import cProfile
+import io
+import json
 import os
-import zipfile
-from github import Github
+import pstats
 import tempfile
-
-# Retrieve the GitHub personal access token
-github_access_token = st.secrets["github"]["access_token"]
+from cache import DEFAULT_CACHE_DIR, SheetCache, file_digest
+from engines import DEFAULT_ENGINE, ENGINES
+from manifest import delta_filename, load_manifest, manifest_path
+from outputs import OUTPUT_FILENAMES, OUTPUT_FORMATS
+from publish import PublishJob
+from sheet_plan import build_sheet_plan, source_sheets
+from spool import UploadSpool
+
+# Streamlit re-executes this script on every interaction, so it only imports what
+# the page needs to render: the pipeline (pandas, the Excel readers) is imported
+# when a run starts and the GitHub client when the first result is published.
 
 # GitHub credentials and repository details
 github_username = 'KeeObom'
 repository_name = 'lobs_reserves'
-github_token = github_access_token
 repo_path = f"{github_username}/{repository_name}"
 
-# Initialize GitHub client
-g = Github(github_token)
-repo = g.get_repo(repo_path)
+# Same default as extraction.DEFAULT_WORKERS, without importing the readers
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+@st.cache_resource
+def get_repo():
+    # GitHub client and repository handle, created on first use and shared by
+    # every session of this server process
+    from github import Github
+
+    github_token = st.secrets["github"]["access_token"]
+    return Github(github_token).get_repo(repo_path)
+
+
+@st.cache_resource
+def get_scheduler():
+    # Queue of "Generate All" runs shared by every session of this server process
+    from scheduler import JobScheduler
+
+    return JobScheduler()
+
+
+@st.cache_resource
+def get_preparse_executor():
+    # Process pool that parses uploads in the background, shared by every session;
+    # the runs read the workbooks not parsed yet on it too, so the app never uses
+    # more worker processes than this pool has
+    from extraction import create_executor
+
+    return create_executor(DEFAULT_WORKERS)
+
+
+def replace_broken_executor(broken):
+    # A new background parse pool in place of one that is broken (a worker
+    # process died, e.g. killed for running out of memory, and the pool rejects
+    # every task from then on). A pool another session replaced already is kept.
+    if get_preparse_executor() is broken:
+        get_preparse_executor.clear()
+        broken.shutdown(wait=False, cancel_futures=True)
+    return get_preparse_executor()
+
+
+def submit_preparse(jobs, keys, files, sheets, cache_dir):
+    # Start the background parses of the uploads on the shared pool, replacing
+    # the pool once if it is broken. Returns False if they cannot be submitted:
+    # background parsing is then off for this render and a run reads every
+    # workbook itself.
+    from concurrent.futures.process import BrokenProcessPool
+
+    from preparse import release_jobs, start_preparse
+
+    executor = get_preparse_executor()
+    try:
+        try:
+            start_preparse(executor, jobs, keys, files, sheets, cache_dir=cache_dir)
+        except BrokenProcessPool:
+            start_preparse(replace_broken_executor(executor), jobs, keys, files, sheets, cache_dir=cache_dir)
+    except Exception as e:
+        release_jobs(jobs)
+        st.sidebar.warning(f"Background parsing is unavailable: {e}")
+        return False
+    return True
+
+def show_profile(trace, profiler=None):
+    # Per-stage spans of the run: a sortable table, the time spent per workbook to
+    # spot the straggler, a timeline and the trace as a download
+    st.subheader("Run Profile")
+    spans = trace.to_frame()
+    st.dataframe(spans, use_container_width=True)
+
+    per_file = spans.dropna(subset=["file"]).groupby("file")["seconds"].sum().sort_values(ascending=False)
+    if not per_file.empty:
+        st.caption("Time per workbook")
+        st.dataframe(per_file.rename("seconds").reset_index(), use_container_width=True)
+
+    timeline = spans.assign(end=spans["start"] + spans["seconds"],
+                            lane=spans["stage"] + " (pid " + spans["pid"].astype(str) + ")")
+    st.vega_lite_chart(timeline, {
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": "start", "type": "quantitative", "title": "seconds"},
+            "x2": {"field": "end"},
+            "y": {"field": "lane", "type": "nominal", "title": None},
+            "color": {"field": "stage", "type": "nominal"},
+            "tooltip": [{"field": field} for field in ["stage", "file", "sheet", "seconds", "rows", "bytes"]],
+        },
+    }, use_container_width=True)
+    st.download_button("Download Trace (Chrome trace JSON)", json.dumps(trace.chrome_trace()),
+                       file_name="lobs_reserves_trace.json", mime="application/json")
+
+    if profiler is not None:
+        stats_text = io.StringIO()
+        pstats.Stats(profiler, stream=stats_text).sort_stats("cumulative").print_stats(30)
+        st.code(stats_text.getvalue())
+        with tempfile.TemporaryDirectory() as tmp:
+            profile_path = os.path.join(tmp, "lobs_reserves.prof")
+            profiler.dump_stats(profile_path)
+            with open(profile_path, "rb") as f:
+                st.download_button("Download cProfile Stats", f.read(), file_name="lobs_reserves.prof")
+
+
+def generate_zip(job, files, plan, state, preparse_jobs, workers, use_cache, spill, output_format,
+                 compresslevel, profile_run, base_manifest=None, engine=DEFAULT_ENGINE, executor=None,
+                 incremental=True):
+    # The "Generate All" run, on a scheduler worker thread. Streamlit calls are
+    # not allowed there, so what the page shows is reported to the job instead.
+    # preparse_jobs are the background parses handed over to the run (see
+    # preparse.take_jobs) and executor the pool they run on, which also reads the
+    # other workbooks. With incremental, the merge state is kept for the next run
+    # and so compacted.
+    from concurrent.futures.process import BrokenProcessPool
+
+    from pipeline import PipelineRun
+
+    profiler = cProfile.Profile() if profile_run else None
+    if profiler:
+        profiler.enable()
+
+    # Reuse the merged sheets of the previous run: only workbooks that are not
+    # merged yet have to be read
+    run = PipelineRun(files, plan, state=state, spill=spill, engine=engine, compact=incremental)
+    try:
+        if run.state.keys:
+            job.report("info", f"Incremental merge: {len(run.new_files)} added and {run.removed} removed workbooks")
+
+        # Plan the (file, sheet) reads from the workbook manifests before parsing
+        read_plan = run.plan_reads()
+        if run.new_files:
+            job.report("caption", f"Read plan: {sum(len(sheets) for sheets in read_plan)} sheets "
+                                  f"from {sum(1 for sheets in read_plan if sheets)} of {len(run.new_files)} workbooks")
+
+        # Read every new workbook once, spread over a pool of worker processes;
+        # the workbooks parsed in the background are only waited for
+        preparsed = None
+        if preparse_jobs is not None:
+            from preparse import collect_results
+
+            preparsed = collect_results(preparse_jobs, [key for key, _ in run.new_files])
+        job.set_progress(0.0, "Reading workbooks")
+        read_options = dict(workers=workers, cache_dir=DEFAULT_CACHE_DIR if use_cache else None, preparsed=preparsed,
+                            on_result=lambda done, total: job.set_progress(done / total,
+                                                                           f"Read {done}/{total} workbooks"))
+        try:
+            run.read(executor=executor, **read_options)
+        except BrokenProcessPool:
+            if executor is None:
+                raise
+            # A worker of the shared pool died; read again on a new pool
+            run.read(executor=replace_broken_executor(executor), **read_options)
+
+        cache_stats = None
+        if use_cache:
+            try:
+                cache = SheetCache(DEFAULT_CACHE_DIR)
+                cache.evict()
+                cache_stats = (f"{run.cache_hits} hits / {run.cache_misses} misses this run, "
+                               f"{cache.size() / 2**20:.0f} of {cache.max_bytes / 2**20:.0f} MB used")
+            except OSError:
+                # Already reported by every workbook read
+                pass
+
+        for error in run.errors:
+            job.report("error", error)
+        # A read error may be transient (memory, I/O), so a run with errors is
+        # not reused by the next Generate All with the same files
+        if run.errors:
+            job.shareable = False
+
+        # Merge in the original lob_files + reinsurance_files order. A workbook
+        # that failed to read is read again on the next run.
+        run.merge()
+        state = run.state if not spill and not run.errors else None
+
+        processed_sheets = run.take_processed_sheets()
+        for sheet in processed_sheets:
+            job.report("success", f"Processed {sheet}")
+
+        # Stream the sheets into a ZIP on disk, kept as long as the job along with
+        # its manifest; each sheet is freed once written. With the manifest of an
+        # earlier package, only the sheets that changed since are packed.
+        job.set_progress(1.0, "Writing the ZIP")
+        fd, zip_path = tempfile.mkstemp(suffix=".zip")
+        os.close(fd)
+        job.temp_paths += [zip_path, manifest_path(zip_path)]
+        manifest = run.write(zip_path, processed_sheets, output_format, compresslevel=compresslevel,
+                             base_manifest=base_manifest)
+        if base_manifest is not None:
+            job.report("info", f"Delta package: {len(manifest['delta']['sheets'])} of "
+                               f"{len(manifest['sheets'])} sheets changed since the previous manifest")
+    finally:
+        run.close()
+        if profiler:
+            profiler.disable()
+    zip_name = OUTPUT_FILENAMES[output_format]
+    return {"zip_path": zip_path, "zip_name": delta_filename(zip_name) if base_manifest is not None else zip_name,
+            "manifest_name": os.path.basename(manifest_path(zip_name)), "delta": base_manifest is not None,
+            "state": state, "trace": run.trace, "profiler": profiler, "cache_stats": cache_stats}
+
+
+def show_job(job, owner, incremental):
+    # Wait for the session's run, showing its place in the queue and then its
+    # progress, and show its results. owner is whether this session submitted
+    # the run, and so whether its merge state is the one to keep.
+    scheduler = get_scheduler()
+    if not job.done:
+        status = st.empty()
+        bar = st.progress(0.0)
+        while not job.wait(0.5):
+            position = scheduler.position(job)
+            if position:
+                status.info(f"Waiting for a free worker: position {position} in the queue")
+            else:
+                value, text = job.progress
+                status.info(text or "Running")
+                bar.progress(value)
+        status.empty()
+        bar.empty()
+
+    for kind, text in job.messages:
+        getattr(st, kind)(text)
+    if job.status == "failed":
+        st.error(f"The run failed: {job.error}")
+        return
+    result = job.result
+    try:
+        with open(result["zip_path"], "rb") as f:
+            zip_data = f.read()
+        with open(manifest_path(result["zip_path"]), "rb") as f:
+            manifest_data = f.read()
+    except (OSError, TypeError):
+        st.warning("The result of this run has expired; click Generate All to run it again.")
+        st.session_state.pop("generate_job", None)
+        return
+
+    if result["cache_stats"]:
+        st.sidebar.subheader("Parse Cache")
+        st.sidebar.write(result["cache_stats"])
+
+    zip_name = result["zip_name"]
+    if st.session_state.get("handled_job") != job.id:
+        st.session_state["handled_job"] = job.id
+        if owner:
+            state = result.pop("state", None)
+            if incremental and state is not None:
+                st.session_state["merge_state"] = state
+            else:
+                st.session_state.pop("merge_state", None)
+
+        # Upload to GitHub in the background (skipped when the file there already
+        # has this content); the download does not wait for it. A full package
+        # is published with its manifest; a delta package carries its own.
+        uploads = [(zip_name, zip_data)]
+        if not result["delta"]:
+            uploads.append((result["manifest_name"], manifest_data))
+        st.session_state["publish_jobs"] = [PublishJob(get_repo, f"Dodo_results/{name}", data, branch="main").start()
+                                            for name, data in uploads]
+
+    # Download buttons
+    st.success("All sheets processed and ZIP file created.")
+    st.download_button("Download Processed Sheets", zip_data, file_name=zip_name)
+    st.download_button("Download Manifest", manifest_data, file_name=result["manifest_name"],
+                       help="Upload it as the previous manifest to get a delta package on a later run")
+
+    st.info("Please click the button above to save your file.")
+
+    show_profile(result["trace"], result["profiler"])
+
+
+def show_selected_files(container, label, files, keys, jobs):
+    # The uploaded files with the state of their background parse
+    from preparse import STATUS_ICONS, job_status
+
+    container.write(label)
+    for file, key in zip(files, keys):
+        icon = STATUS_ICONS[job_status(jobs[key])] if key in jobs else ""
+        container.write(f"{icon} {file.name}".strip())
+
+
+def show_publish_status():
+    # Status of the background uploads of the last run; the app keeps serving
+    # while they run and any interaction refreshes them
+    jobs = st.session_state.get("publish_jobs")
+    if not jobs:
+        return
+    st.sidebar.subheader("GitHub Publish")
+    for job in jobs:
+        github_url = f"https://github.com/{github_username}/{repository_name}/blob/{job.branch}/{job.path}"
+        if not job.done:
+            st.sidebar.info(f"Uploading {job.path} to GitHub...")
+        elif job.status == "failed":
+            st.sidebar.error(f"Upload of {job.path} failed: {job.error}")
+        elif job.status == "unchanged":
+            st.sidebar.success(f"{job.path} is already up to date on GitHub")
+            st.sidebar.markdown(f"[Download from GitHub]({github_url})")
+        else:
+            st.sidebar.success(f"{job.path} {job.status} on GitHub")
+            st.sidebar.markdown(f"[Download from GitHub]({github_url})")
+    if not all(job.done for job in jobs):
+        st.sidebar.button("Refresh status")
+
 
 # Streamlit App
 def main():
@@ -27,91 +332,123 @@ def main():
     lob_files = st.sidebar.file_uploader("Upload Line of Business Files", accept_multiple_files=True, type=["xlsx", "xlsb"])
     reinsurance_files = st.sidebar.file_uploader("Upload Reinsurance Files", accept_multiple_files=True, type=["xlsx", "xlsb"])
 
+    # Every upload is written to disk once, when it is first selected; runs and
+    # background parses read it from there instead of from the upload's bytes.
+    # If the spool folder cannot be used, the uploads are read from memory.
+    spool = st.session_state.setdefault("upload_spool", UploadSpool())
+    try:
+        uploads = spool.sync(lob_files + reinsurance_files)
+        lob_files, reinsurance_files = uploads[:len(lob_files)], uploads[len(lob_files):]
+    except OSError as e:
+        st.sidebar.warning(f"Uploads are kept in memory: {e}")
+
     st.sidebar.subheader("Selected Files")
-    if lob_files:
-        st.sidebar.write("LOB Files:", [f.name for f in lob_files])
-    if reinsurance_files:
-        st.sidebar.write("Reinsurance Files:", [f.name for f in reinsurance_files])
-
-    # Sheet groups
-    group1_sheets = ["ACTUALS_FOR_VISUALIZATION", "ACTUARIAL_AOM_IMPACT", "CF_T1_PVFC_LIC_CLO",
-                     "CF_T1_PVFC_LIC_INCEXP_LIC_INCR", "CF_T1_PVFC_LIC_INCLAIM_LIC_INCR", "CURVE_ID_PARAM",
-                     "INITIALIZATION", "MANDATORY_ACTUALS", "MP_GOC", "MP_GOC_SEG", "OCI_OPTION_DERECOG",
-                     "CF_T1_PVFC_LIC_CLO_FADJ_PY", "CF_T1_PVFC_LIC_OP", "CF_T1_PVFC_LIC_TEXPVAR_PY"]
-    group2_sheets = ["CF_T1_PVFC_LIC_CLO_FADJ_PY", "CF_T1_PVFC_LIC_CLO_TADJ_PY", "CF_T1_PVFC_LIC_DEREC",
-                     "CF_T1_PVFC_LIC_EXPCLO_PY"]
-    group3_sheets = ["CF_T1_PVFC_LIC_OP", "CF_T1_PVFC_LIC_OP_FADJ_PY", "CF_T1_PVFC_LIC_OP_TADJ_PY"]
-    group4_sheets = ["CF_T1_PVFC_LIC_TEXPVAR_PY", "CF_T1_PVFC_LIC_TASSCHG_PY", "CF_T1_PVFC_LIC_FASSCHG_PY",
-                     "CF_T1_PVFC_LIC_FEXPVAR_PY"]
+    # Filled in below, once the settings say whether uploads are parsed ahead
+    selected_files = st.sidebar.container()
+
+    st.sidebar.subheader("Settings")
+    workers = st.sidebar.number_input("Worker processes", min_value=1, max_value=max(DEFAULT_WORKERS, 1),
+                                      value=DEFAULT_WORKERS, step=1)
+    compresslevel = st.sidebar.slider("ZIP compression level", min_value=0, max_value=9, value=6)
+    output_format = st.sidebar.selectbox("Output format", list(OUTPUT_FORMATS), index=0,
+                                         format_func=lambda f: {"csv": "CSV (ZIP)", "parquet": "Parquet (ZIP)"}[f])
+    engine = st.sidebar.selectbox("CSV writer", list(ENGINES), index=list(ENGINES).index(DEFAULT_ENGINE),
+                                  help="Engine writing the CSV files: pandas is the reference, arrow formats them "
+                                       "on several threads and writes the same bytes. Reading and merging use "
+                                       "pandas with either.")
+    use_cache = st.sidebar.checkbox("Cache parsed sheets", value=True,
+                                    help="Re-runs only parse the workbooks whose content changed")
+    incremental = st.sidebar.checkbox("Incremental re-merge", value=True,
+                                      help="Keep the merged sheets between runs and only splice in or out "
+                                           "the workbooks that were added, removed or replaced")
+    spill = st.sidebar.checkbox("Spill to disk", value=False,
+                                help="For very large runs: keep the per-file sheets on disk and merge one sheet at "
+                                     "a time while writing the ZIP (no incremental re-merge)")
+    preparse = st.sidebar.checkbox("Parse uploads in the background", value=True,
+                                   help="Start reading each workbook as soon as it is uploaded, so Generate All "
+                                        "mostly merges and writes (not used with Spill to disk)")
+    previous_manifest = st.sidebar.file_uploader(
+        "Previous manifest (delta package)", type=["json"],
+        help="The manifest of the package downstream already has: only the sheets that changed since are packed "
+             "(apply it with: python pipeline.py apply-delta)")
+    base_manifest = None
+    if previous_manifest is not None:
+        try:
+            base_manifest = load_manifest(previous_manifest)
+        except ValueError as e:
+            st.sidebar.error(f"{previous_manifest.name} is not a package manifest: {e}")
+    profile_run = st.sidebar.checkbox("Profile with cProfile", value=False,
+                                      help="Profile the app process during the run; reads are only included "
+                                           "with 1 worker process")
+
+    # Every output sheet is read from the workbooks; sheets listed in two groups are
+    # read and merged once
+    plan = build_sheet_plan()
+    total_sheets = source_sheets(plan)
 
     all_files = lob_files + reinsurance_files
-    total_sheets = group1_sheets + group2_sheets + group3_sheets + group4_sheets
+
+    # Background parsing of the uploads; a job is cancelled and dropped when its
+    # file is removed, and all of them when background parsing is off. preparse
+    # (and with it the readers and pandas) is only imported once there are jobs.
+    jobs = st.session_state.setdefault("preparse_jobs", {})
+    background = preparse and not spill
+    if jobs and (not all_files or not background):
+        from preparse import release_jobs
+
+        release_jobs(jobs)
+    if all_files and background:
+        from incremental import upload_keys
+
+        keys = upload_keys(all_files)
+        background = submit_preparse(jobs, keys, all_files, total_sheets,
+                                     cache_dir=DEFAULT_CACHE_DIR if use_cache else None)
+    if all_files and background:
+        from preparse import job_status
+
+        show_selected_files(selected_files, "LOB Files:", lob_files, keys[:len(lob_files)], jobs)
+        show_selected_files(selected_files, "Reinsurance Files:", reinsurance_files, keys[len(lob_files):], jobs)
+        if any(job_status(job) == "parsing" for job in jobs.values()):
+            selected_files.button("Refresh parse status")
+    else:
+        if lob_files:
+            selected_files.write("LOB Files:", [f.name for f in lob_files])
+        if reinsurance_files:
+            selected_files.write("Reinsurance Files:", [f.name for f in reinsurance_files])
 
     if st.button("Generate All"):
         if not all_files:
             st.error("Please upload at least one file.")
             return
 
-        processed_sheets = {}
-        progress = st.progress(0)
-
-        for i, sheet in enumerate(total_sheets):
-            merged_df = pd.DataFrame()
-
-            for file in all_files:
-                try:
-                    ext = os.path.splitext(file.name)[-1].lower()
-                    excel_file = pd.ExcelFile(file, engine='pyxlsb' if ext == '.xlsb' else None)
-                    if sheet not in excel_file.sheet_names:
-                        continue
-                    df = pd.read_excel(excel_file, sheet_name=sheet, skiprows=8)
-
-                    # Normalize numeric columns conditionally
-                    for col in df.columns[1:]:
-                        numeric_like = df[col].apply(
-                            lambda x: isinstance(x, (int, float)) or str(x).replace('.', '', 1).isdigit()
-                        )
-                        if numeric_like.mean() > 0.9:
-                            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-                    merged_df = pd.concat([merged_df, df], ignore_index=True)
-
-                except Exception as e:
-                    st.error(f"Error reading {sheet} from {file.name}: {e}")
-
-            # Specific column cleanup
-            if sheet == "ACTUARIAL_AOM_IMPACT" and "* MACRO_STEP_ID_DESCRIPTION" in merged_df.columns:
-                merged_df = merged_df.drop(columns="* MACRO_STEP_ID_DESCRIPTION")
-
-            processed_sheets[sheet] = merged_df
-            st.success(f"Processed {sheet}")
-            progress.progress((i + 1) / len(total_sheets))
-
-        # Create ZIP in memory
-        zip_buffer = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-        with zipfile.ZipFile(zip_buffer.name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for sheet, df in processed_sheets.items():
-                zipf.writestr(f"{sheet}.csv", df.to_csv(index=False))
-
-        zip_buffer.seek(0)
-        zip_path = zip_buffer.name
-
-        # Upload to GitHub
-        github_file_path = "Dodo_results/processed_sheets.zip"
-        try:
-            contents = repo.get_contents(github_file_path)
-            repo.update_file(github_file_path, f"Update {github_file_path}", zip_buffer.read(), contents.sha, branch="main")
-        except:
-            zip_buffer.seek(0)
-            repo.create_file(github_file_path, f"Create {github_file_path}", zip_buffer.read(), branch="main")
-
-        # Download buttons
-        zip_buffer.seek(0)
-        st.success("All sheets processed and ZIP file created.")
-        st.markdown(f"[Download from GitHub](https://github.com/{github_username}/{repository_name}/blob/main/{github_file_path})")
-        st.download_button("Download Processed Sheets", zip_buffer.read(), file_name="processed_sheets.zip")
-
-        st.info("Please click the button above to save your file.")
+        from incremental import upload_keys
+
+        # Sessions generating from the same workbook contents share one run and
+        # one ZIP; the run waits in the process-wide queue for a free worker
+        keys = upload_keys(all_files)
+        job_key = (tuple(digest for _, digest, _ in keys), output_format, engine, compresslevel, profile_run,
+                   file_digest(previous_manifest.getvalue()) if base_manifest is not None else None)
+        # The background parses are handed over to the run here, on the script
+        # thread, so the session's jobs are never touched by the run's thread
+        preparse_jobs = executor = None
+        if background:
+            from preparse import take_jobs
+
+            preparse_jobs = take_jobs(jobs, keys)
+            executor = get_preparse_executor()
+        job, created = get_scheduler().submit(
+            job_key, generate_zip, all_files, plan, st.session_state.get("merge_state") if incremental else None,
+            preparse_jobs, workers=int(workers), use_cache=use_cache, spill=spill,
+            output_format=output_format, compresslevel=compresslevel, profile_run=profile_run,
+            base_manifest=base_manifest, engine=engine, executor=executor, incremental=incremental)
+        st.session_state["generate_job"] = job
+        st.session_state["generate_job_owner"] = created
+
+    job = st.session_state.get("generate_job")
+    if job is not None:
+        show_job(job, st.session_state.get("generate_job_owner", False), incremental)
+
+    show_publish_status()
 
 if __name__ == "__main__":
     main()
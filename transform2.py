@@ -5,6 +5,9 @@ import shutil
 from io import BytesIO
 import zipfile
 from github import Github
+from merge import merge_frames
+from outputs import write_csv_zip
+from sheet_plan import build_sheet_plan, source_sheets
 
 # Retrieve the GitHub personal access token
 # github_access_token = st.secrets["github"]["access_token"]
@@ -58,23 +61,8 @@ if st.button("Generate All"):
         # Combine the lists of files
         all_files = lob_files + reinsurance_files
 
-        # # Define the sheet names you want to process
-        # group1_sheets = ["ACTUALS_FOR_VISUALIZATION", "CF_T1_PVFC_LIC_CLO_FADJ_PY",
-        #          "CF_T1_PVFC_LIC_OP", "CF_T1_PVFC_LIC_TEXPVAR_PY"]  # first group of sheets
-        # group2_sheets = ["CF_T1_PVFC_LIC_CLO_FADJ_PY"]  # second group of sheets
-        # group3_sheets = ["CF_T1_PVFC_LIC_OP"]  # third group of sheets
-        # group4_sheets = ["CF_T1_PVFC_LIC_TEXPVAR_PY"]  # fourth group of sheets
-
-        # Define the sheet names you want to process
-        group1_sheets = ["ACTUALS_FOR_VISUALIZATION", "ACTUARIAL_AOM_IMPACT", "CF_T1_PVFC_LIC_CLO","CF_T1_PVFC_LIC_INCEXP_LIC_INCR",
-                       "CF_T1_PVFC_LIC_INCLAIM_LIC_INCR","CURVE_ID_PARAM","INITIALIZATION","MANDATORY_ACTUALS",
-                       "MP_GOC","MP_GOC_SEG","OCI_OPTION_DERECOG", "CF_T1_PVFC_LIC_CLO_FADJ_PY",
-                       "CF_T1_PVFC_LIC_OP", "CF_T1_PVFC_LIC_TEXPVAR_PY"]  # first group of sheets
-        group2_sheets = ["CF_T1_PVFC_LIC_CLO_FADJ_PY", "CF_T1_PVFC_LIC_CLO_TADJ_PY",
-                         "CF_T1_PVFC_LIC_DEREC","CF_T1_PVFC_LIC_EXPCLO_PY"]  # second group of sheets
-        group3_sheets = ["CF_T1_PVFC_LIC_OP", "CF_T1_PVFC_LIC_OP_FADJ_PY","CF_T1_PVFC_LIC_OP_TADJ_PY"]  # third group of sheets
-        group4_sheets = ["CF_T1_PVFC_LIC_TEXPVAR_PY", "CF_T1_PVFC_LIC_TASSCHG_PY",
-                         "CF_T1_PVFC_LIC_FASSCHG_PY","CF_T1_PVFC_LIC_FEXPVAR_PY"]  # fourth group of sheets
+        # Groups 2, 3 and 4 are copies of the first sheet in each group
+        plan = build_sheet_plan(copy_groups=True)
 
         # Create a progress bar
         progress_bar = st.progress(0)
@@ -82,48 +70,22 @@ if st.button("Generate All"):
         # Initialize a list to store processed sheet DataFrames
         processed_sheets = {}
 
-        # Process each sheet and save to the results folder
-        total_sheets = group1_sheets + group2_sheets + group3_sheets + group4_sheets
-
-        # Track the first sheet in groups 2, 3, and 4
-        first_sheet_group2 = group2_sheets[0]
-        first_sheet_group3 = group3_sheets[0]
-        first_sheet_group4 = group4_sheets[0]
+        # Process each source sheet once; aliases are written from the same data
+        total_sheets = source_sheets(plan)
 
         # Define the ZIP file name on GitHub
         zip_file_name = "Dodo_results/processed_sheets.zip"
 
         for sheet_name in total_sheets:
-            if sheet_name in group1_sheets:
-                # Process each sheet in group 1 and save them in the processed_sheets dictionary
-                merged_data = pd.DataFrame()
-                for uploaded_file in all_files:
-                    try:
-                        df = pd.read_excel(uploaded_file, sheet_name=sheet_name, skiprows=8, engine='pyxlsb')
-                        merged_data = pd.concat([merged_data, df], ignore_index=True)
-                    except Exception as e:
-                        st.error(f"Error reading {sheet_name} from {uploaded_file.name}: {e}")
-
-                processed_sheets[sheet_name] = merged_data
-                st.success(f"Processed {sheet_name}")
-
-            elif sheet_name in group2_sheets:
-                # For group 2, duplicate the first sheet in the group and save in the processed_sheets dictionary
-                original_sheet = processed_sheets[first_sheet_group2]
-                processed_sheets[sheet_name] = original_sheet.copy()
-                st.success(f"Processed {sheet_name}")
-
-            elif sheet_name in group3_sheets:
-                # For group 3, duplicate the first sheet in the group and save in the processed_sheets dictionary
-                original_sheet = processed_sheets[first_sheet_group3]
-                processed_sheets[sheet_name] = original_sheet.copy()
-                st.success(f"Processed {sheet_name}")
-
-            elif sheet_name in group4_sheets:
-                # For group 4, duplicate the first sheet in the group and save in the processed_sheets dictionary
-                original_sheet = processed_sheets[first_sheet_group4]
-                processed_sheets[sheet_name] = original_sheet.copy()
-                st.success(f"Processed {sheet_name}")
+            # Process each sheet and save them in the processed_sheets dictionary
+            frames = []
+            for uploaded_file in all_files:
+                try:
+                    frames.append(pd.read_excel(uploaded_file, sheet_name=sheet_name, skiprows=8, engine='pyxlsb'))
+                except Exception as e:
+                    st.error(f"Error reading {sheet_name} from {uploaded_file.name}: {e}")
+            processed_sheets[sheet_name] = merge_frames(frames)
+            st.success(f"Processed {sheet_name}")
 
             # Update the progress bar
             progress_bar.progress((total_sheets.index(sheet_name) + 1) / len(total_sheets))
@@ -147,10 +109,7 @@ if st.button("Generate All"):
         #         zipf.writestr(f"{sheet_name}.csv", csv_data.encode())
 
         # Generate and save the ZIP file on your local machine
-        with zipfile.ZipFile("processed_sheets.zip", 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for sheet_name, df in processed_sheets.items():
-                csv_data = df.to_csv(index=False)
-                zipf.writestr(f"{sheet_name}.csv", csv_data.encode())
+        write_csv_zip("processed_sheets.zip", plan, processed_sheets)
 
         # Read the content of the generated ZIP file
         with open("processed_sheets.zip", 'rb') as zip_file:
@@ -0,0 +1,207 @@
+import posixpath
+import re
+import struct
+import zipfile
+import xml.etree.ElementTree as ET
+
+# Reads only the workbook manifest of an .xlsx/.xlsb file (sheet names, and on
+# request a sheet's dimension record) without loading shared strings, styles or
+# cell data, so the reads of a run can be planned before any heavy parsing.
+
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_OFFICE_DOCUMENT = _REL_NS + "/officeDocument"
+_SHARED_STRINGS = _REL_NS + "/sharedStrings"
+
+# BIFF12 record ids (see pyxlsb.biff12)
+_BRT_BUNDLE_SH = 0x019C
+_BRT_END_BUNDLE_SHS = 0x0190
+_BRT_WS_DIM = 0x0194
+_BRT_BEGIN_SHEET_DATA = 0x0191
+_BRT_SST_ITEM = 0x0013
+
+
+def _read_rels(zf, path):
+    rels_path = posixpath.join(posixpath.dirname(path), "_rels", posixpath.basename(path) + ".rels")
+    with zf.open(rels_path) as f:
+        root = ET.parse(f).getroot()
+    rels = {}
+    for el in root:
+        target = el.attrib["Target"]
+        if target.startswith("/"):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(path), target))
+        rels[el.attrib["Id"]] = (el.attrib.get("Type"), target)
+    return rels
+
+
+def _workbook_part(zf):
+    try:
+        for rel_type, target in _read_rels(zf, "").values():
+            if rel_type == _OFFICE_DOCUMENT:
+                return target
+    except KeyError:
+        pass
+    names = set(zf.namelist())
+    return "xl/workbook.bin" if "xl/workbook.bin" in names else "xl/workbook.xml"
+
+
+def biff12_records(f, chunk_size=1 << 20):
+    # Yields (record id, payload) from a BIFF12 stream, reading it in chunks
+    buf, pos, end = b"", 0, 0
+    while True:
+        # A record header is at most 8 bytes; refill when the next header or
+        # payload is not complete in the buffer
+        if end - pos < 8:
+            buf, pos = buf[pos:] + f.read(chunk_size), 0
+            end = len(buf)
+            if not end:
+                return
+        rec_id, size = buf[pos], buf[pos + 1] if pos + 1 < end else 0
+        if rec_id < 0x80 and size < 0x80:
+            # One-byte id and length, the common case for cell records
+            pos += 2
+        else:
+            rec_id = 0
+            for i in range(4):
+                b = buf[pos]
+                pos += 1
+                rec_id |= b << (8 * i)
+                if not b & 0x80:
+                    break
+            size = 0
+            for i in range(4):
+                b = buf[pos]
+                pos += 1
+                size |= (b & 0x7F) << (7 * i)
+                if not b & 0x80:
+                    break
+        if pos + size > end:
+            buf, pos = buf[pos:] + f.read(max(chunk_size, size)), 0
+            end = len(buf)
+            if size > end:
+                return
+        yield rec_id, buf[pos:pos + size]
+        pos += size
+
+
+def _biff12_string(data, offset):
+    (length,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    return data[offset:offset + 2 * length].decode("utf-16-le"), offset + 2 * length
+
+
+def _cell_ref(ref):
+    # "F59" -> (59, 6)
+    m = re.match(r"([A-Z]+)(\d+)", ref)
+    col = 0
+    for ch in m.group(1):
+        col = col * 26 + ord(ch) - 64
+    return int(m.group(2)), col
+
+
+class WorkbookIndex:
+    def __init__(self, file):
+        self.file = file
+        self._zf = zipfile.ZipFile(file)
+        self._workbook = _workbook_part(self._zf)
+        self.binary = self._workbook.endswith(".bin")
+        rels = _read_rels(self._zf, self._workbook)
+        sheets = self._read_sheets_bin() if self.binary else self._read_sheets_xml()
+        # {sheet name: worksheet part}
+        self.parts = {name: rels[rid][1] for name, rid in sheets if rid in rels}
+        self.sheet_names = list(self.parts)
+        self.shared_strings_part = next((target for rel_type, target in rels.values()
+                                         if rel_type == _SHARED_STRINGS), None)
+        if self.shared_strings_part is None and self.binary and "xl/sharedStrings.bin" in self._zf.namelist():
+            self.shared_strings_part = "xl/sharedStrings.bin"
+        self._shared_strings = None
+
+    def _read_sheets_xml(self):
+        sheets = []
+        with self._zf.open(self._workbook) as f:
+            for _, el in ET.iterparse(f, events=("end",)):
+                tag = el.tag.rsplit("}", 1)[-1]
+                if tag == "sheet":
+                    sheets.append((el.attrib["name"], el.attrib[f"{{{_REL_NS}}}id"]))
+                elif tag == "sheets":
+                    break
+        return sheets
+
+    def _read_sheets_bin(self):
+        sheets = []
+        with self._zf.open(self._workbook) as f:
+            for rec_id, data in biff12_records(f):
+                if rec_id == _BRT_BUNDLE_SH:
+                    rid, offset = _biff12_string(data, 8)
+                    name, _ = _biff12_string(data, offset)
+                    sheets.append((name, rid))
+                elif rec_id == _BRT_END_BUNDLE_SHS:
+                    break
+        return sheets
+
+    def has_sheet(self, sheet):
+        return sheet in self.parts
+
+    def open_part(self, sheet):
+        # Stream of the worksheet part of one sheet
+        return self._zf.open(self.parts[sheet])
+
+    def shared_strings(self):
+        # The shared string table of an .xlsb workbook as a list, decoded on the
+        # first call and kept for the reads of the other sheets
+        if self._shared_strings is None:
+            strings = []
+            if self.shared_strings_part is not None:
+                with self._zf.open(self.shared_strings_part) as f:
+                    for rec_id, data in biff12_records(f):
+                        if rec_id == _BRT_SST_ITEM:
+                            strings.append(_biff12_string(data, 1)[0])
+            self._shared_strings = strings
+        return self._shared_strings
+
+    def dimensions(self, sheet):
+        # (rows, columns) of the used range from the sheet's dimension record, read
+        # from the head of the worksheet part only; None when the sheet has none
+        with self._zf.open(self.parts[sheet]) as f:
+            if self.binary:
+                for rec_id, data in biff12_records(f):
+                    if rec_id == _BRT_WS_DIM:
+                        r1, r2, c1, c2 = struct.unpack_from("<IIII", data)
+                        return r2 + 1, c2 + 1
+                    if rec_id == _BRT_BEGIN_SHEET_DATA:
+                        return None
+                return None
+            for _, el in ET.iterparse(f, events=("start",)):
+                tag = el.tag.rsplit("}", 1)[-1]
+                if tag == "dimension":
+                    return _cell_ref(el.attrib["ref"].split(":")[-1])
+                if tag == "sheetData":
+                    return None
+        return None
+
+    def close(self):
+        self._shared_strings = None
+        self._zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def plan_reads(files, sheets, on_error=None):
+    # For every file, the requested sheets it actually contains, from the workbook
+    # manifests alone. A file whose manifest cannot be read keeps the full list and
+    # is left to the regular reader (and its error reporting).
+    reads = []
+    for file in files:
+        try:
+            with WorkbookIndex(file) as index:
+                reads.append([sheet for sheet in sheets if index.has_sheet(sheet)])
+        except Exception as e:
+            if on_error:
+                on_error(file, e)
+            reads.append(list(sheets))
+    return reads
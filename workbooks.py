@@ -0,0 +1,62 @@
+import os
+import pandas as pd
+
+from workbook_index import WorkbookIndex
+from xlsb_reader import UnsupportedLayout, read_xlsb_sheet
+
+
+# A workbook session opens an uploaded file (Streamlit UploadedFile or a path on
+# disk) exactly once and serves every sheet read from that single handle, instead
+# of building a new pd.ExcelFile for every (sheet, file) pair. Sheet names come
+# from the workbook manifest; the Excel engine is only started on the first read.
+# .xlsb sheets are decoded directly from their records (xlsb_reader) and only go
+# through pd.read_excel when their layout needs pandas' general handling.
+class WorkbookSession:
+    def __init__(self, file, name=None):
+        self.file = file
+        self.name = name or getattr(file, "name", file)
+        self._excel_file = None
+        self._index = None
+        try:
+            index = WorkbookIndex(file)
+        except Exception:
+            self.sheet_names = set(self.excel_file.sheet_names)
+        else:
+            self.sheet_names = set(index.sheet_names)
+            if index.binary:
+                self._index = index
+            else:
+                index.close()
+
+    @property
+    def excel_file(self):
+        if self._excel_file is None:
+            ext = os.path.splitext(self.name)[-1].lower()
+            self._excel_file = pd.ExcelFile(self.file, engine='pyxlsb' if ext == '.xlsb' else None)
+        return self._excel_file
+
+    def has_sheet(self, sheet):
+        return sheet in self.sheet_names
+
+    def read(self, sheet, skiprows=8, usecols=None, dtype=None):
+        # usecols and dtype as in pd.read_excel (usecols as a callable on the
+        # column names), e.g. from schemas.SheetSchema.read_options()
+        if self._index is not None and self._index.has_sheet(sheet):
+            try:
+                return read_xlsb_sheet(self._index, sheet, skiprows=skiprows, usecols=usecols, dtype=dtype)
+            except UnsupportedLayout:
+                pass
+        return pd.read_excel(self.excel_file, sheet_name=sheet, skiprows=skiprows, usecols=usecols, dtype=dtype)
+
+    def close(self):
+        if self._index is not None:
+            self._index.close()
+        if self._excel_file is not None:
+            self._excel_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
@@ -0,0 +1,203 @@
+import struct
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+from workbook_index import biff12_records
+
+# Reads one .xlsb sheet straight from its BIFF12 records into per-column buffers.
+# pd.read_excel(engine='pyxlsb') builds a namedtuple for every cell, pads every
+# row to the full sheet width and then re-infers every column from Python
+# objects; here numeric columns go into preallocated float64 arrays as the
+# records are decoded, and only columns holding text (or nothing) are handed to
+# pandas' own parser, so the result is the frame read_excel would return.
+
+# BIFF12 cell records (see pyxlsb.biff12)
+_ROW = 0x0000
+_BLANK = 0x0001
+_NUM = 0x0002
+_BOOLERR = 0x0003
+_BOOL = 0x0004
+_FLOAT = 0x0005
+_STRING = 0x0007
+_FORMULA_STRING = 0x0008
+_FORMULA_FLOAT = 0x0009
+_FORMULA_BOOL = 0x000A
+_FORMULA_BOOLERR = 0x000B
+_SHEETDATA_END = 0x0192
+
+_U32 = struct.Struct("<I")
+_I32 = struct.Struct("<i")
+_DOUBLE = struct.Struct("<d")
+_FLOAT_CELL = struct.Struct("<IId")
+
+# Integral values beyond this are left to pandas (int64 vs float precision)
+_MAX_EXACT = 2.0 ** 53
+
+
+class UnsupportedLayout(Exception):
+    # The sheet needs pandas' general header handling (duplicate column names, no
+    # header or data rows); the caller falls back to read_excel
+    pass
+
+
+def _rk(raw):
+    # RK number, decoded like pyxlsb's read_float
+    (value,) = _I32.unpack_from(raw, 8)
+    if value & 0x02:
+        number = float(value >> 2)
+    else:
+        number = _DOUBLE.unpack(b"\x00\x00\x00\x00" + _U32.pack(value & 0xFFFFFFFC))[0]
+    if value & 0x01:
+        number /= 100
+    return number
+
+
+def _cell_value(rec_id, data, strings):
+    # Value of a cell record as pandas' pyxlsb reader sees it, None for blanks
+    if rec_id == _FLOAT or rec_id == _FORMULA_FLOAT:
+        return _DOUBLE.unpack_from(data, 8)[0]
+    if rec_id == _NUM:
+        return _rk(data)
+    if rec_id == _STRING:
+        return strings[_U32.unpack_from(data, 8)[0]]
+    if rec_id == _FORMULA_STRING:
+        (length,) = _U32.unpack_from(data, 8)
+        return data[12:12 + 2 * length].decode("utf-16-le")
+    if rec_id == _BOOL or rec_id == _FORMULA_BOOL:
+        return data[8] != 0
+    if rec_id == _BOOLERR or rec_id == _FORMULA_BOOLERR:
+        return hex(data[8])
+    return None
+
+
+class _Column:
+    # Values of one column: a float64 buffer while every value is a number, a
+    # list of raw values (blanks as "") once a non-numeric value shows up
+    __slots__ = ("values", "objects", "integral")
+
+    def __init__(self, capacity):
+        self.values = np.full(capacity, np.nan)
+        self.objects = None
+        self.integral = True
+
+    def set(self, i, value):
+        if self.objects is None:
+            if type(value) is float and abs(value) < _MAX_EXACT:
+                if i >= len(self.values):
+                    grown = np.full(max(2 * len(self.values), i + 1), np.nan)
+                    grown[:len(self.values)] = self.values
+                    self.values = grown
+                if self.integral and not value.is_integer():
+                    self.integral = False
+                self.values[i] = value
+                return
+            self.objects = [self._object(v) for v in self.values.tolist()]
+        if i >= len(self.objects):
+            self.objects.extend([""] * (i + 1 - len(self.objects)))
+        self.objects[i] = self._object(value)
+
+    @staticmethod
+    def _object(value):
+        # pandas turns integral floats into ints and blanks into ""
+        if type(value) is float:
+            if value != value:
+                return ""
+            if value.is_integer():
+                return int(value)
+        return value
+
+    def numeric(self, rows):
+        values = self.values[:rows]
+        if len(values) < rows:
+            values = np.concatenate([values, np.full(rows - len(values), np.nan)])
+        # Integral cells become ints in pandas, so -0.0 reads back as 0
+        values = values + 0.0
+        if self.integral and not np.isnan(values).any():
+            return values.astype(np.int64)
+        return values
+
+    def raw(self, rows):
+        if self.objects is None:
+            return [self._object(v) for v in self.numeric(rows).tolist()]
+        objects = self.objects[:rows]
+        return objects + [""] * (rows - len(objects))
+
+
+def read_xlsb_sheet(index, sheet, skiprows=8, usecols=None, dtype=None):
+    # index is an open WorkbookIndex of the workbook. Returns what
+    # pd.read_excel(file, sheet_name=sheet, skiprows=skiprows, engine='pyxlsb',
+    # usecols=usecols, dtype=dtype) returns for sheets with a header row of
+    # distinct names; usecols is a callable on the column names and dtype a dict.
+    # Numeric header cells (the projection periods 0, 1, ... of the cash-flow
+    # sheets) become column names as in pandas: ints when integral, else floats.
+    strings = index.shared_strings()
+    dims = index.dimensions(sheet)
+    capacity = max(dims[0] - skiprows - 1, 1) if dims else 1024
+
+    header, columns = {}, {}
+    width, last, row = 0, -1, -1
+    with index.open_part(sheet) as f:
+        for rec_id, data in biff12_records(f):
+            if rec_id == _ROW:
+                row = _U32.unpack_from(data)[0]
+                continue
+            if rec_id == _SHEETDATA_END:
+                break
+            if rec_id > _FORMULA_BOOLERR or rec_id == _BLANK:
+                continue
+            if rec_id == _FLOAT or rec_id == _FORMULA_FLOAT:
+                col, _, value = _FLOAT_CELL.unpack_from(data)
+            else:
+                value = _cell_value(rec_id, data, strings)
+                if value is None or (type(value) is str and value == ""):
+                    continue
+                col = _U32.unpack_from(data)[0]
+            if col >= width:
+                width = col + 1
+            if row < skiprows:
+                continue
+            if row == skiprows:
+                header[col] = value
+                continue
+            i = row - skiprows - 1
+            if i > last:
+                last = i
+            column = columns.get(col)
+            if column is None:
+                column = columns[col] = _Column(capacity)
+            column.set(i, value)
+
+    rows = last + 1
+    if not header or rows == 0 or width < 2:
+        raise UnsupportedLayout(sheet)
+    names = []
+    for col in range(width):
+        name = _Column._object(header.get(col, ""))
+        names.append(f"Unnamed: {col}" if name == "" else name)
+    # 1, 1.0 and True are one name to a dict, so they count as duplicates too
+    if len(set(names)) != len(names) or len({str(name) for name in names}) != len(names):
+        raise UnsupportedLayout(sheet)
+
+    # Columns with text or no values at all, and the columns given a dtype, go
+    # through pandas' parser so that na_values, bool conversion, mixed-type
+    # inference and the dtype conversion match read_excel
+    dtype = dtype or {}
+    result, parsed = {}, []
+    for col, name in enumerate(names):
+        if usecols is not None and not usecols(name):
+            continue
+        column = columns.get(col)
+        if column is not None and column.objects is None and name not in dtype:
+            result[name] = column.numeric(rows)
+        else:
+            result[name] = None
+            parsed.append((name, column.raw(rows) if column is not None else [""] * rows))
+    if parsed:
+        table = [[name for name, _ in parsed]] + [list(values) for values in zip(*(raw for _, raw in parsed))]
+        parsed_frame = TextParser(table, header=0, skip_blank_lines=False,
+                                  dtype={name: dtype[name] for name, _ in parsed if name in dtype} or None).read()
+        for name, _ in parsed:
+            result[name] = parsed_frame[name]
+    return pd.DataFrame(result)